@@ -17,6 +17,9 @@ BUGZILLA_BUG = "https://bugzilla.mozilla.org/show_bug.cgi?id=%d"
 
 DEFAULT_TIMEOUT = 60
 
+# Tests in this tier only look at the ZIP central directory.
+PRESCREEN_TIER = 0
+
 DESCRIPTION_TYPES = types.StringTypes + (list, tuple)
 
 # The maximum size of any string in JS analysis.
@@ -24,6 +27,25 @@ MAX_STR_SIZE = 1024 * 24  # 24KB
 
 MAX_RESOURCE_SIZE = 2 * 1024 * 1024
 
+# The number of bytes of decompressed package members to keep in memory.
+MAX_FILE_CACHE_SIZE = 32 * 1024 * 1024
+
+# Decompression limits for packages. The compression ratio is only checked
+# for files that decompress to more than RATIO_CHECK_MIN_SIZE bytes.
+MAX_UNCOMPRESSED_SIZE = 1024 * 1024 * 1024
+MAX_MEMBER_SIZE = 256 * 1024 * 1024
+MAX_COMPRESSION_RATIO = 200
+RATIO_CHECK_MIN_SIZE = 1024 * 1024
+
+# Bump this whenever a change to the validator alters its results, so that
+# cached results are no longer used.
+RULESET_VERSION = 1
+
+# How long validation results are cached for, in seconds, and how many bytes
+# of results the cache may hold.
+RESULT_CACHE_TTL = 24 * 60 * 60
+RESULT_CACHE_MAX_SIZE = 256 * 1024 * 1024
+
 ICON_LIMIT = 10
 
 MAX_GARBAGE = 100 * 1024
@@ -1,7 +1,71 @@
+import re
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+
 import unicodehelper
 
 
 INFINITY = float("inf")
+NEWLINE = re.compile("\n")
+
+# The number of recently used context generators a bundle keeps around.
+CACHE_SIZE = 8
+
+
+def get_context_generator(data, err=None):
+    """Return a context generator for `data`. Generators are cached on the
+    error bundle `err`, so the tests which look at the same file share a
+    single line index. Without a bundle, a new generator is returned."""
+
+    cache = getattr(err, "context_generators", None)
+    if cache is None:
+        return ContextGenerator(data)
+
+    generator = cache.pop(data, None)
+    if generator is None:
+        generator = ContextGenerator(data)
+        if len(cache) >= CACHE_SIZE:
+            cache.popitem(last=False)
+    cache[data] = generator
+    return generator
+
+
+class LineIndex(object):
+    """A sequence of the lines in a blob of text. Only the offsets of the
+    newlines are stored; lines are sliced out of the original text when they
+    are requested."""
+
+    def __init__(self, data):
+        self.source = data
+        self.newlines = array("l", [m.start() for m in
+                                    NEWLINE.finditer(data)])
+
+    def __len__(self):
+        return len(self.newlines) + 1
+
+    def __iter__(self):
+        start = 0
+        for end in self.newlines:
+            yield self.source[start:end]
+            start = end + 1
+        yield self.source[start:]
+
+    def __getitem__(self, index):
+        length = len(self.newlines) + 1
+        if index < 0:
+            index += length
+        if not 0 <= index < length:
+            raise IndexError("line index out of range")
+
+        start = self.newlines[index - 1] + 1 if index else 0
+        if index < length - 1:
+            return self.source[start:self.newlines[index]]
+        return self.source[start:]
+
+    def line_at(self, position):
+        """Return the one-based line number that a position falls on."""
+        return bisect_left(self.newlines, position) + 1
 
 
 class ContextGenerator:
@@ -10,7 +74,7 @@ class ContextGenerator:
     for errors, warnings, and the like."""
 
     def __init__(self, data=None):
-        self.data = data.split("\n")
+        self.data = LineIndex(data)
 
     def get_context(self, line=1, column=0):
         """Return a tuple containing the context for a line."""
@@ -103,13 +167,4 @@ class ContextGenerator:
     def get_line(self, position):
         """Returns the line number that the given string position is found on."""
 
-        datalen = len(self.data)
-        count = len(self.data[0])
-        line = 1
-        while count < position:
-            if line >= datalen:
-                break
-            count += len(self.data[line]) + 1
-            line += 1
-
-        return line
+        return self.data.line_at(position)
@@ -1,6 +1,9 @@
+import heapq
+import itertools
 import sys
 import types
 import uuid
+from collections import OrderedDict
 from StringIO import StringIO
 
 import json
@@ -9,6 +12,11 @@ from .outputhandlers.shellcolors import OutputHandler
 from .. import unicodehelper
 
 
+MESSAGE_TYPES = ("errors", "warnings", "notices")
+MESSAGE_FIELDS = ("uid", "id", "message", "description", "file", "line",
+                  "column", "tier", "context")
+
+
 class BaseErrorBundle(object):
     """Keyword Arguments:
 
@@ -16,16 +24,26 @@ class BaseErrorBundle(object):
         Whether the validator should continue after a tier fails
     **instant**
         Who knows what this does
+    **fail_fast**
+        Whether the validator should stop as soon as an error is found
+    **max_tier**
+        The highest tier of tests to run, or None to run every tier
 
     """
 
-    def __init__(self, determined=True, instant=False, *args, **kwargs):
+    def __init__(self, determined=True, instant=False, fail_fast=False,
+                 max_tier=None, *args, **kwargs):
 
         self.handler = None
 
-        self.errors = []
-        self.warnings = []
-        self.notices = []
+        # Messages are stored in per-tier buckets so that discarding the
+        # messages from unfinished tiers doesn't require a scan of every
+        # stack. Each entry is a `(sequence, message)` pair; the sequence
+        # number preserves the order the messages were raised in.
+        self._message_buckets = dict((t, {}) for t in MESSAGE_TYPES)
+        self._message_keys = dict((t, set()) for t in MESSAGE_TYPES)
+        self._message_counts = dict((t, 0) for t in MESSAGE_TYPES)
+        self._message_sequence = itertools.count()
 
         self.ending_tier = self.tier = 1
 
@@ -33,6 +51,15 @@ class BaseErrorBundle(object):
 
         self.instant = instant
         self.determined = determined
+        self.fail_fast = fail_fast
+        self.max_tier = max_tier
+
+        # Whether this bundle was spawned from another one.
+        self.spawned = False
+
+        # The context generators of the files tested with this bundle, most
+        # recently used last. See `contextgenerator.get_context_generator`.
+        self.context_generators = OrderedDict()
 
         super(BaseErrorBundle, self).__init__(*args, **kwargs)
 
@@ -58,12 +85,9 @@ class BaseErrorBundle(object):
                 "context": None,
             }
 
-            destination = getattr(self, type_)
             # Don't show duplicate messages.
-            if any(x["id"] == message["id"] and
-                   x["file"] == message["file"] and
-                   x["line"] == message["line"] and
-                   x["column"] == message["column"] for x in destination):
+            key = _message_key(message)
+            if key in self._message_keys[type_]:
                 return self
 
             context = kwargs.get("context")
@@ -75,7 +99,7 @@ class BaseErrorBundle(object):
                         line=message["line"], column=message["column"])
 
             # Append the message to the right stack.
-            destination.append(message)
+            self._store_message(type_, message, key)
 
             # If instant mode is turned on, output the message immediately.
             if self.instant:
@@ -89,6 +113,26 @@ class BaseErrorBundle(object):
     warning = _message("warnings", "warning")
     notice = _message("notices", "notice")
 
+    def _store_message(self, type_, message, key):
+        """Add a message to the bucket for its tier."""
+        self._message_keys[type_].add(key)
+        self._message_counts[type_] += 1
+        self._message_buckets[type_].setdefault(
+            message["tier"], []).append(
+                (next(self._message_sequence), message))
+
+    def _get_messages(self, type_):
+        """Return the messages of the given type in the order that they
+        were raised."""
+        buckets = self._message_buckets[type_].values()
+        if len(buckets) == 1:
+            return [message for seq, message in buckets[0]]
+        return [message for seq, message in heapq.merge(*buckets)]
+
+    errors = property(lambda self: self._get_messages("errors"))
+    warnings = property(lambda self: self._get_messages("warnings"))
+    notices = property(lambda self: self._get_messages("notices"))
+
     def set_tier(self, tier):
         "Updates the tier and ending tier"
         self.tier = tier
@@ -97,13 +141,25 @@ class BaseErrorBundle(object):
 
     @property
     def message_count(self):
-        return len(self.errors) + len(self.warnings) + len(self.notices)
+        return sum(self._message_counts.values())
 
     def failed(self, fail_on_warnings=True):
         """Returns a boolean value describing whether the validation
         succeeded or not."""
 
-        return bool(self.errors) or (fail_on_warnings and bool(self.warnings))
+        counts = self._message_counts
+        return bool(counts["errors"] or
+                    (fail_on_warnings and counts["warnings"]))
+
+    def should_halt(self):
+        """Returns whether validation should stop early because the bundle is
+        in fail-fast mode and an error has been found. The validation is
+        marked as unfinished when that is the case."""
+
+        if self.fail_fast and self._message_counts["errors"]:
+            self.unfinished = True
+            return True
+        return False
 
     def render_json(self):
         "Returns a JSON summary of the validation operation."
@@ -111,10 +167,11 @@ class BaseErrorBundle(object):
         types = {0: "unknown", 8: "webapp"}
         output = {"ending_tier": self.ending_tier,
                   "success": not self.failed(),
+                  "partial": self.unfinished,
                   "messages": [],
-                  "errors": len(self.errors),
-                  "warnings": len(self.warnings),
-                  "notices": len(self.notices)}
+                  "errors": self._message_counts["errors"],
+                  "warnings": self._message_counts["warnings"],
+                  "notices": self._message_counts["notices"]}
 
         messages = output["messages"]
 
@@ -140,6 +197,65 @@ class BaseErrorBundle(object):
         """Override this method to extend the JSON produced by the bundle."""
         pass
 
+    def serialize(self):
+        """Return the state of the bundle as plain Python containers. The
+        result can be pickled and sent to another process, where it may be
+        folded into another bundle with `merge`."""
+        return self._serialize()
+
+    def _serialize(self):
+        """Override this method to extend the serialized state of the
+        bundle."""
+        return {"tier": self.tier,
+                "ending_tier": self.ending_tier,
+                "unfinished": self.unfinished,
+                "messages": dict(
+                    (type_, [tuple(message[field] for
+                                   field in MESSAGE_FIELDS) for
+                             message in self._get_messages(type_)]) for
+                    type_ in MESSAGE_TYPES)}
+
+    def spawn(self):
+        """Return an empty bundle with the same settings as this one. The
+        findings of a single piece of work, such as the tests of one file, can
+        be collected in it and folded back into this bundle with `merge`."""
+        child = object.__new__(type(self))
+        self._spawn(child)
+        return child
+
+    def _spawn(self, child):
+        """Override this method to set up the state of a spawned bundle."""
+        BaseErrorBundle.__init__(child, determined=self.determined,
+                                 instant=self.instant,
+                                 fail_fast=self.fail_fast,
+                                 max_tier=self.max_tier)
+        child.handler = self.handler
+        child.tier = child.ending_tier = self.tier
+        child.spawned = True
+
+    def merge(self, other):
+        """Merge another bundle, or the serialized state of one, into this
+        bundle. Messages are appended in the order they were raised in the
+        other bundle, skipping any that duplicate a message already present,
+        so merging shards in a fixed order always gives the same result."""
+        if isinstance(other, BaseErrorBundle):
+            other = other.serialize()
+        self._merge(other)
+        return self
+
+    def _merge(self, state):
+        """Override this method to merge extra serialized state."""
+        for type_ in MESSAGE_TYPES:
+            for fields in state["messages"][type_]:
+                message = dict(zip(MESSAGE_FIELDS, fields))
+                key = _message_key(message)
+                if key not in self._message_keys[type_]:
+                    self._store_message(type_, message, key)
+
+        if state["ending_tier"] > self.ending_tier:
+            self.ending_tier = state["ending_tier"]
+        self.unfinished = self.unfinished or state["unfinished"]
+
     def print_summary(self, verbose=False, no_color=False):
         "Prints a summary of the validation process so far."
 
@@ -149,7 +265,7 @@ class BaseErrorBundle(object):
         # Make a neat little printout.
         self.handler.write("\n<<GREEN>>Summary:").write("-" * 30)
         self.handler.write("%s Errors, %s Warnings, %s Notices" %
-            (len(self.errors), len(self.warnings), len(self.notices)))
+            tuple(self._message_counts[t] for t in MESSAGE_TYPES))
 
 
         if self.failed():
@@ -248,7 +364,24 @@ class BaseErrorBundle(object):
         greater than the ending tier.
         """
 
-        for stack in [self.errors, self.warnings, self.notices]:
-            for message in stack:
-                if message["tier"] > ending_tier:
-                    stack.remove(message)
+        for type_ in MESSAGE_TYPES:
+            buckets = self._message_buckets[type_]
+            discarded = [tier for tier in buckets if tier > ending_tier]
+            if not discarded:
+                continue
+
+            for tier in discarded:
+                self._message_counts[type_] -= len(buckets.pop(tier))
+
+            self._message_keys[type_] = set(
+                _message_key(message) for message in
+                self._get_messages(type_))
+
+
+def _message_key(message):
+    """Return the key used to detect duplicate messages."""
+    id_ = message["id"]
+    file_ = message["file"]
+    return (tuple(id_) if isinstance(id_, list) else id_,
+            tuple(file_) if isinstance(file_, list) else file_,
+            message["line"], message["column"])
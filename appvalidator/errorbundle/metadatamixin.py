@@ -61,3 +61,54 @@ class MetadataMixin(object):
                          feature_profile=list(self.feature_profile),
                          feature_usage=dict(self.feature_usage))
         return extension
+
+    def _spawn(self, child):
+        """Spawned bundles share the resources of this bundle, but collect
+        their own metadata and feature usage."""
+        super(MetadataMixin, self)._spawn(child)
+        child.resources = self.resources
+        child.pushable_resources = self.pushable_resources
+        child.final_context = None
+        child.metadata = {}
+        child.feature_profile = set()
+        child.feature_usage = defaultdict(list)
+
+    def _serialize(self):
+        """Add the resources, metadata, and feature usage to the serialized
+        state of the bundle. The resources of a spawned bundle belong to the
+        bundle it was spawned from, so they are left out."""
+        state = super(MetadataMixin, self)._serialize()
+        if not self.spawned:
+            state.update(resources=self.resources,
+                         pushable_resources=self.pushable_resources)
+        state.update(metadata=self.metadata,
+                     feature_profile=sorted(self.feature_profile),
+                     feature_usage=dict(self.feature_usage))
+        return state
+
+    def _merge(self, state):
+        """Merge the resources, metadata, and feature usage of a serialized
+        bundle into this one."""
+        super(MetadataMixin, self)._merge(state)
+
+        _merge_dict(self.resources, state.get("resources", {}))
+        _merge_dict(self.pushable_resources,
+                    state.get("pushable_resources", {}))
+        _merge_dict(self.metadata, state["metadata"])
+
+        self.feature_profile.update(state["feature_profile"])
+        for feature in sorted(state["feature_usage"]):
+            self.feature_usage[feature].extend(
+                state["feature_usage"][feature])
+
+
+def _merge_dict(target, source):
+    """Update `target` with the values in `source`. Dicts are merged into
+    the existing value rather than replacing it."""
+    for key, value in source.iteritems():
+        if isinstance(value, dict):
+            if not isinstance(target.get(key), dict):
+                target[key] = {}
+            _merge_dict(target[key], value)
+        else:
+            target[key] = value
@@ -0,0 +1,244 @@
+"""
+Fingerprints of known libraries. The sha256 whitelist only recognizes exact
+copies of a library, so a changed banner comment, an added sourceMappingURL
+line or reindentation is enough to have the library tested in full. A
+fingerprint is instead the hash of the library's normalized token stream,
+with comments and whitespace stripped.
+
+Libraries are also found within scripts that bundle them with other code.
+Each fingerprint keeps the first `ANCHOR_SIZE` characters of the normalized
+library, which are looked for at the statement boundaries of a script; where
+one is found, the hash of the normalized text that follows confirms the
+match. The regions of a script which hold known libraries can then be left
+out of its tests.
+"""
+
+from bisect import bisect_right
+from collections import namedtuple
+import hashlib
+import json
+import re
+
+ANCHOR_SIZE = 64
+
+TOKEN = re.compile(r"""
+    (?P<gap>(?:\s+|//[^\r\n]*|/\*[\s\S]*?(?:\*/|\Z))+)
+  | (?P<string>"(?:[^"\\\r\n]|\\[\s\S])*"?|
+               '(?:[^'\\\r\n]|\\[\s\S])*'?|
+               `(?:[^`\\]|\\[\s\S])*`?)
+  | (?P<code>[^\s/"'`]+)
+  | (?P<slash>/)
+""", re.VERBOSE)
+REGEX_LITERAL = re.compile(r"/(?:[^/\\\r\n\[]|\\.|\[(?:[^\]\\\r\n]|\\.)*\])+/"
+                           r"[\w$]*")
+# A slash after one of these characters or keywords starts a regular
+# expression rather than a division.
+REGEX_PRECEDERS = set("(,=:[!&|?{};+-*%<>~^")
+REGEX_KEYWORDS = re.compile(r"(?:^|[^\w$])(?:return|typeof|case|do|else|in|"
+                            r"of|new|delete|void|throw|instanceof|yield)$")
+# Libraries within a bundle start after the end of a statement or block.
+BOUNDARY = re.compile(r"[;{})]")
+# Identifiers and the words within strings are copied into the normalized
+# text as they are, so those of a library's anchor are found verbatim in any
+# script that holds the library.
+WORD = re.compile(r"[\w$]+")
+
+
+class Library(namedtuple("Library", "name version digest size anchor")):
+    """The fingerprint of a library: the hash and size of its normalized
+    text, and the first `ANCHOR_SIZE` characters of that text."""
+
+
+def _is_word(char):
+    return char.isalnum() or char in "_$" or ord(char) > 127
+
+
+def _needs_space(before, after):
+    """Return whether two tokens which were separated by whitespace or a
+    comment need to be kept apart."""
+    return (_is_word(before) and _is_word(after) or
+            before == after and before in "+-")
+
+
+def _regex_allowed(last):
+    """Return whether a slash following the token `last` starts a regular
+    expression."""
+    return (not last or last[-1] in REGEX_PRECEDERS or
+            REGEX_KEYWORDS.search(last) is not None)
+
+
+def normalize(data):
+    """Strip the comments and whitespace from a script. Whitespace is kept,
+    as a single space, only where it separates two tokens. Returns the
+    normalized text and a list of `(normalized offset, original offset)`
+    pairs marking where each run of copied text starts."""
+
+    pieces = []
+    segments = []
+    size = 0
+    last = ""
+    gap = False
+    pos = 0
+    while pos < len(data):
+        match = TOKEN.match(data, pos)
+        kind = match.lastgroup
+        if kind == "gap":
+            gap = True
+            pos = match.end()
+            continue
+        elif kind == "slash" and _regex_allowed(last):
+            match = REGEX_LITERAL.match(data, pos) or match
+
+        token = match.group()
+        if gap and last and _needs_space(last[-1], token[0]):
+            pieces.append(" ")
+            segments.append((size, pos - 1))
+            size += 1
+        elif gap or not segments:
+            segments.append((size, pos))
+
+        gap = False
+        pieces.append(token)
+        size += len(token)
+        last = token
+        pos = match.end()
+
+    return "".join(pieces), segments
+
+
+def _digest(normalized):
+    if isinstance(normalized, unicode):
+        normalized = normalized.encode("utf-8")
+    return hashlib.sha256(normalized).hexdigest()
+
+
+def _original_offset(segments, offset):
+    """Map an offset in normalized text to the original text."""
+    normalized, original = segments[
+        bisect_right(segments, (offset, float("inf"))) - 1]
+    return original + offset - normalized
+
+
+def fingerprint(name, version, data):
+    """Return the fingerprint of a library."""
+    normalized = normalize(data)[0]
+    return Library(name, version, _digest(normalized), len(normalized),
+                   normalized[:ANCHOR_SIZE])
+
+
+def write_fingerprints(libraries, path):
+    """Write a list of fingerprints to `path`."""
+    with open(path, "w") as file_:
+        json.dump([library._asdict() for library in
+                   sorted(set(libraries))], file_, indent=1, sort_keys=True)
+
+
+def read_fingerprints(path):
+    """Read a list of fingerprints from `path`."""
+    with open(path) as file_:
+        return [Library(**library) for library in json.load(file_)]
+
+
+def blank_regions(data, regions):
+    """Replace the `(start, end)` regions of a script with whitespace. Line
+    breaks are kept, and the last line of each region is padded with spaces,
+    so the rest of the script keeps its line and column numbers."""
+    pieces = []
+    pos = 0
+    for start, end in regions:
+        pieces.append(data[pos:start])
+        region = data[start:end]
+        lines = region.count("\n")
+        if lines:
+            pieces.append("\n" * lines +
+                          " " * (len(region) - region.rfind("\n") - 1))
+        else:
+            pieces.append(" " * len(region))
+        pos = end
+    pieces.append(data[pos:])
+    return "".join(pieces)
+
+
+class FingerprintIndex(object):
+    """The fingerprints of known libraries, read from the file at `path` the
+    first time they are used."""
+
+    def __init__(self, path):
+        self.path = path
+        self._digests = None
+        self._anchors = None
+        self._probes = None
+        self._min_size = None
+
+    def _load(self):
+        if self._digests is not None:
+            return
+        digests = {}
+        anchors = {}
+        probes = set()
+        for library in read_fingerprints(self.path):
+            digests[library.digest] = library
+            if library.size >= ANCHOR_SIZE:
+                anchors.setdefault(library.anchor, []).append(library)
+            # The longest words of the anchor are the least likely to turn
+            # up in scripts that don't hold the library, so they are looked
+            # for first.
+            probes.add(tuple(sorted(set(WORD.findall(library.anchor)),
+                                    key=len, reverse=True)))
+        self._digests = digests
+        self._anchors = anchors
+        self._probes = probes
+        self._min_size = min(library.size for library in
+                             digests.itervalues()) if digests else 0
+
+    def _may_hold_library(self, data):
+        """Return whether a script could hold any of the libraries. This is
+        far cheaper than normalizing the script. A normalized script is
+        never longer than the script, and it can only hold a library if
+        every word of the library's anchor is in the script."""
+        return (len(data) >= self._min_size and
+                any(all(word in data for word in words) for
+                    words in self._probes))
+
+    def __len__(self):
+        self._load()
+        return len(self._digests)
+
+    def find(self, data, bundles=True):
+        """Find the known libraries in a script. Returns a list of
+        `(library, start, end)` tuples giving the region of the script that
+        holds each library. A script which is a library in its entirety is
+        a single region covering the whole script. The script is only
+        scanned for libraries bundled with other code if `bundles` is
+        set."""
+
+        self._load()
+        if not self._digests or not self._may_hold_library(data):
+            return []
+
+        normalized, segments = normalize(data)
+        if not normalized:
+            return []
+        library = self._digests.get(_digest(normalized))
+        if library is not None:
+            return [(library, 0, len(data))]
+        if not bundles:
+            return []
+
+        found = []
+        position = 0
+        starts = [0] + [match.end() for match in
+                        BOUNDARY.finditer(normalized)]
+        for start in starts:
+            if start < position:
+                continue
+            for library in self._anchors.get(
+                    normalized[start:start + ANCHOR_SIZE], ()):
+                end = start + library.size
+                if _digest(normalized[start:end]) == library.digest:
+                    found.append(
+                        (library, _original_offset(segments, start),
+                         _original_offset(segments, end - 1) + 1))
+                    position = end
+                    break
+        return found
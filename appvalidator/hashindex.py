@@ -0,0 +1,144 @@
+"""
+A compact index of sha256 digests, used to whitelist known libraries. The
+index is a binary file holding a bloom filter followed by the sorted, raw
+digests. It is memory-mapped the first time it is used, so only the pages
+that lookups touch are ever read, and most digests which aren't in the index
+are turned away by the bloom filter without searching it.
+
+The file starts with a header of the form
+
+    magic ("AVHI"), version, bloom hash count, bloom size, digest count
+
+followed by the bloom filter and then the digests. Scripts, stylesheets and
+markup each have an index of their own.
+"""
+
+import binascii
+import mmap
+import os
+import struct
+
+MAGIC = "AVHI"
+VERSION = 1
+HEADER = struct.Struct("<4sBBxxII")
+DIGEST_SIZE = 32
+
+BLOOM_BITS_PER_ENTRY = 10
+BLOOM_HASHES = 7
+
+# Files of these types are whitelisted by their hashes. Each type has its own
+# index, so a known file is only skipped if it has the type it is known as.
+WHITELIST_TYPES = {".js": "js", ".css": "css", ".html": "markup",
+                   ".xhtml": "markup", ".xml": "markup"}
+INDEX_NAMES = {"js": "%s.idx", "css": "%s-css.idx",
+               "markup": "%s-markup.idx"}
+
+
+def whitelist_type(name):
+    """Return the type of whitelist a file may be found in, or None."""
+    extension = os.path.splitext(name.lower())[1]
+    return WHITELIST_TYPES.get(extension)
+
+
+def index_path(base, type_):
+    """Return the path of the index for a type of file. `base` is the path
+    of the indexes without their extension."""
+    return INDEX_NAMES[type_] % base
+
+
+def _bloom_bits(digest, hashes, size):
+    """Return the bloom filter bits for a raw digest. The digest is already
+    a uniformly distributed hash, so the bits are derived from it directly
+    by double hashing."""
+    h1, h2 = struct.unpack_from("<QQ", digest)
+    h2 |= 1
+    return [(h1 + i * h2) % size for i in xrange(hashes)]
+
+
+def write_index(digests, path, bits_per_entry=BLOOM_BITS_PER_ENTRY,
+                hashes=BLOOM_HASHES):
+    """Write an index of the hex `digests` to `path`."""
+    digests = sorted(set(binascii.unhexlify(digest) for digest in digests))
+
+    bloom = bytearray(max(1, (len(digests) * bits_per_entry + 7) // 8))
+    for digest in digests:
+        for bit in _bloom_bits(digest, hashes, len(bloom) * 8):
+            bloom[bit // 8] |= 1 << (bit % 8)
+
+    temp_path = "%s.%d.tmp" % (path, os.getpid())
+    with open(temp_path, "wb") as file_:
+        file_.write(HEADER.pack(MAGIC, VERSION, hashes, len(bloom),
+                                len(digests)))
+        file_.write(bloom)
+        for digest in digests:
+            file_.write(digest)
+    os.rename(temp_path, path)
+
+
+class HashIndex(object):
+    """A read-only index of sha256 digests, which supports the `in` operator
+    with hex digests. The index file at `path` is opened the first time the
+    index is used."""
+
+    def __init__(self, path):
+        self.path = path
+        self._mapped = None
+
+    def _map(self):
+        if self._mapped is not None:
+            return self._mapped
+
+        with open(self.path, "rb") as file_:
+            mapped = mmap.mmap(file_.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if len(mapped) < HEADER.size:
+            raise ValueError("%s is not a hash index" % self.path)
+        magic, version, hashes, bloom_size, count = HEADER.unpack_from(mapped)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("%s is not a hash index" % self.path)
+        self._bloom_start = HEADER.size
+        self._bloom_size = bloom_size
+        self._hashes = hashes
+        self._digests_start = HEADER.size + bloom_size
+        self._count = count
+        if len(mapped) != self._digests_start + count * DIGEST_SIZE:
+            raise ValueError("%s is truncated" % self.path)
+
+        self._mapped = mapped
+        return mapped
+
+    def __len__(self):
+        self._map()
+        return self._count
+
+    def _in_bloom(self, mapped, digest):
+        for bit in _bloom_bits(digest, self._hashes, self._bloom_size * 8):
+            if not ord(mapped[self._bloom_start + bit // 8]) & (1 << bit % 8):
+                return False
+        return True
+
+    def _search(self, mapped, digest):
+        low, high = 0, self._count
+        while low < high:
+            middle = (low + high) // 2
+            start = self._digests_start + middle * DIGEST_SIZE
+            found = mapped[start:start + DIGEST_SIZE]
+            if found == digest:
+                return True
+            elif found < digest:
+                low = middle + 1
+            else:
+                high = middle
+        return False
+
+    def __contains__(self, digest):
+        if not isinstance(digest, basestring) or len(digest) != 64:
+            return False
+        try:
+            digest = binascii.unhexlify(digest)
+        except TypeError:
+            return False
+
+        mapped = self._map()
+        return (self._in_bloom(mapped, digest) and
+                self._search(mapped, digest))
@@ -0,0 +1,167 @@
+"""
+Incremental re-validation. An `Artifact` records the findings of the content
+tests for each member of a package, along with the CRC32 and size of the
+member. When the next version of the package is validated with the same
+artifact, the findings of members whose CRC32 and size haven't changed are
+replayed instead of being computed again.
+"""
+
+import json
+
+from constants import RULESET_VERSION
+from errorbundle.basebundle import MESSAGE_FIELDS
+
+# The version of the format that artifacts are saved in. Artifacts saved in
+# other formats are loaded empty.
+FORMAT_VERSION = 2
+
+UID = MESSAGE_FIELDS.index("uid")
+ID = MESSAGE_FIELDS.index("id")
+
+
+class IncrementalMismatch(AssertionError):
+    """Raised in verify mode when the findings replayed for a member differ
+    from the findings of a full run, or when the options of the validation
+    change while its findings are being recorded. `name` is None in the
+    latter case."""
+
+    def __init__(self, name):
+        super(IncrementalMismatch, self).__init__(
+            "Replayed findings differ for %s" % name if name is not None else
+            "The options changed while the findings were recorded")
+        self.name = name
+
+
+# The resources which the content tests read. The findings of a file depend
+# on them as well as on its content.
+CONTENT_RESOURCES = ("listed", "SPIDERMONKEY", "acorn", "css_tokenize",
+                     "app_type")
+
+
+def artifact_options(err):
+    """Return the options of a validation that affect the findings of the
+    content tests."""
+    options = dict((name, err.get_resource(name)) for
+                   name in CONTENT_RESOURCES)
+    options["ruleset"] = RULESET_VERSION
+    return options
+
+
+# The metadata which describes how a validation ran rather than what it
+# found, such as the statistics of the file cache. Incremental, cached and
+# parallel runs of a package differ in it.
+RUN_METADATA = ("file_cache", )
+
+
+def comparable_findings(findings):
+    """Return findings, or the JSON results of a validation, in a form which
+    can be compared between runs. The uid of each message is left out, since
+    it differs on every run, and so is the metadata in `RUN_METADATA`."""
+    if findings is None:
+        return None
+    findings = json.loads(json.dumps(findings, sort_keys=True))
+    if isinstance(findings["messages"], dict):
+        for messages in findings["messages"].values():
+            for message in messages:
+                message[UID] = None
+    else:
+        for message in findings["messages"]:
+            message["uid"] = None
+    for key in RUN_METADATA:
+        findings["metadata"].pop(key, None)
+    return findings
+
+
+class Artifact(object):
+    """
+    The findings of a previous validation, by member. Each entry holds the
+    CRC32 and size of the member, whether it was processed by the content
+    tests, the serialized state of a bundle holding its findings, and the
+    type of whitelist the member was found in, if any. When
+    `verify` is set, reused members are analyzed anyway and an
+    `IncrementalMismatch` is raised if their findings differ.
+    """
+
+    def __init__(self, members=None, options=None, verify=False):
+        self.members = members or {}
+        self.options = options
+        self.verify = verify
+
+        self.reused = 0
+        self._current = None
+
+    @property
+    def recording(self):
+        """Whether the findings of a validation are being recorded."""
+        return self._current is not None
+
+    def begin(self, options):
+        """Start recording the findings of a new validation. The previous
+        findings are dropped if they were made with other options."""
+        if options != self.options:
+            self.members = {}
+            self.options = options
+        self._current = {}
+        self.reused = 0
+
+    def unchanged(self, name, info):
+        """Return whether the findings of a member can be reused."""
+        entry = self.members.get(name)
+        return (entry is not None and "crc" in info and
+                entry[0] == info["crc"] and entry[1] == info["size"])
+
+    def lookup(self, name, info):
+        """Return the `(processed, findings, whitelisted)` recorded for a
+        member, or None if the member has changed."""
+        if not self.unchanged(name, info):
+            return None
+        self.reused += 1
+        return tuple(self.members[name][2:])
+
+    def record(self, name, info, processed, findings, whitelisted=None):
+        """Record the findings of a member for the next validation."""
+        self._current[name] = (info.get("crc"), info["size"], processed,
+                               findings, whitelisted)
+
+    def finish(self, options=None):
+        """Replace the previous findings with the ones that were recorded.
+        In verify mode, `options` are checked against the ones the findings
+        were recorded with, since findings recorded under options that have
+        since changed can't be trusted."""
+        if self.verify and options is not None and options != self.options:
+            raise IncrementalMismatch(None)
+        if self._current is not None:
+            self.members = self._current
+            self._current = None
+
+    def dumps(self):
+        return json.dumps({"version": FORMAT_VERSION,
+                           "options": self.options,
+                           "members": self.members})
+
+    @classmethod
+    def loads(cls, data, **kwargs):
+        data = json.loads(data)
+        if data.get("version") != FORMAT_VERSION:
+            return cls(**kwargs)
+
+        members = {}
+        for name, (crc, size, processed, findings, whitelisted) in (
+                data["members"].iteritems()):
+            if findings is not None:
+                for messages in findings["messages"].values():
+                    for message in messages:
+                        # Message IDs are tuples, which JSON turns into
+                        # lists.
+                        message[ID] = tuple(message[ID])
+            members[name] = crc, size, processed, findings, whitelisted
+        return cls(members, data["options"], **kwargs)
+
+    def save(self, path):
+        with open(path, "w") as file_:
+            file_.write(self.dumps())
+
+    @classmethod
+    def load(cls, path, **kwargs):
+        with open(path) as file_:
+            return cls.loads(file_.read(), **kwargs)
@@ -46,6 +46,24 @@ def main():
                         const=True,
                         help="Uses Acorn instead of Spidermonkey for JS "
                              "parsing. Requirees Node and Acorn.")
+    parser.add_argument("--fail-fast",
+                        action="store_const",
+                        const=True,
+                        help="Stops validation as soon as an error is found.")
+    parser.add_argument("--prescreen-only",
+                        action="store_const",
+                        const=True,
+                        help="Only runs the tests which look at the ZIP "
+                             "central directory.")
+    parser.add_argument("--css-tokenize",
+                        action="store_const",
+                        const=True,
+                        help="Runs CSS through the full cssutils tokenizer. "
+                             "This is much slower than the default scan.")
+    parser.add_argument("--workers",
+                        type=int,
+                        help="The number of processes to test the files of "
+                             "a packaged app in.")
 
     args = parser.parse_args()
 
@@ -58,18 +76,21 @@ def main():
     if "://" in args.package:
         error_bundle = validate_app(
             requests.get(args.package).content, listed=not args.unlisted,
-            format=None, url=args.package, acorn=args.acorn)
+            format=None, url=args.package, acorn=args.acorn,
+            fail_fast=args.fail_fast)
 
     elif args.package.endswith(".webapp"):
         with open(args.package) as f:
             error_bundle = validate_app(
                 f.read(), listed=not args.unlisted, format=None,
-                acorn=args.acorn)
+                acorn=args.acorn, fail_fast=args.fail_fast)
 
     else:
         error_bundle = validate_packaged_app(
             args.package, listed=not args.unlisted, format=None,
-            timeout=timeout, acorn=args.acorn)
+            timeout=timeout, acorn=args.acorn, fail_fast=args.fail_fast,
+            prescreen_only=args.prescreen_only, workers=args.workers,
+            css_tokenize=bool(args.css_tokenize))
 
     # Print the output of the tests based on the requested format.
     if args.output == "text":
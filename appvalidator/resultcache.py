@@ -0,0 +1,264 @@
+"""
+A cache of validation results. Results are keyed by the sha256 hash of the
+package (or manifest), the rule-set version and the validation options, so
+that a package which is submitted again with the same options is answered
+straight from the cache. The findings of the content tests for single files
+can be cached in the same way, and shared between packages.
+
+A result store is any object with a `get(key)` method, which returns the
+result stored under the key or None, and a `set(key, value)` method. Results
+in the stores here expire `ttl` seconds after they are stored; a `ttl` of
+None keeps them until they are evicted. Once the results in a store add up
+to more than `max_size` bytes, the least recently used results are evicted.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import time
+import uuid
+
+from constants import (RESULT_CACHE_MAX_SIZE, RESULT_CACHE_TTL,
+                       RULESET_VERSION)
+from errorbundle.basebundle import MESSAGE_FIELDS
+from incremental import artifact_options
+from sweep import CHUNK_SIZE
+
+# The metadata which the content tests list under the name of the file.
+FILE_METADATA = ("libraries", "encodings")
+
+
+def hash_data(data):
+    """Return the sha256 hash of a string."""
+    if isinstance(data, unicode):
+        data = data.encode("utf-8")
+    return hashlib.sha256(data).hexdigest()
+
+
+def hash_file(path):
+    """Return the sha256 hash of the file at `path`."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as file_:
+        for chunk in iter(lambda: file_.read(CHUNK_SIZE), ""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def cache_key(digest, **options):
+    """Return the cache key for a package with the hash `digest` which is
+    validated with `options`."""
+    return hash_data("%s:%s:%s" % (RULESET_VERSION, digest,
+                                   json.dumps(options, sort_keys=True)))
+
+
+def rename_findings(findings, name):
+    """Rewrite the findings for a file, in place, as if they had been found
+    in the file `name`. Each message is given a new uid."""
+    for type_, messages in findings["messages"].items():
+        renamed = []
+        for fields in messages:
+            message = dict(zip(MESSAGE_FIELDS, fields))
+            message.update(uid=uuid.uuid4().hex, file=name)
+            renamed.append(tuple(message[field] for
+                                 field in MESSAGE_FIELDS))
+        findings["messages"][type_] = renamed
+    for usages in findings["feature_usage"].values():
+        for usage in usages:
+            usage["file"] = name
+    for key in FILE_METADATA:
+        listed = findings["metadata"].get(key)
+        if listed:
+            findings["metadata"][key] = dict(
+                (name, value) for value in listed.values())
+    return findings
+
+
+def expired(ttl, created, now):
+    """Return whether a result which was stored at `created` has outlived
+    `ttl`."""
+    return ttl is not None and now - created > ttl
+
+
+class FileSystemStore(object):
+    """Stores each result in its own file within the directory `path`. The
+    modification time of a file records when the result was stored and its
+    access time when the result was last used.
+
+    The size of the store is kept as results are stored, so the directory is
+    only listed when results have to be evicted. Results stored by other
+    processes are counted the next time that happens."""
+
+    def __init__(self, path, ttl=RESULT_CACHE_TTL,
+                 max_size=RESULT_CACHE_MAX_SIZE):
+        self.path = path
+        self.ttl = ttl
+        self.max_size = max_size
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        self.size = sum(entry[1] for entry in self._entries())
+
+    def _filename(self, key):
+        return os.path.join(self.path, "%s.json" % key)
+
+    def _entries(self):
+        """Return the access time, size and name of each stored result."""
+        entries = []
+        for name in os.listdir(self.path):
+            if not name.endswith(".json"):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.path, name))
+            except EnvironmentError:
+                continue
+            entries.append((stat.st_atime, stat.st_size, name))
+        return entries
+
+    def get(self, key):
+        filename = self._filename(key)
+        now = time.time()
+        try:
+            stat = os.stat(filename)
+            created = stat.st_mtime
+            if expired(self.ttl, created, now):
+                os.unlink(filename)
+                self.size -= stat.st_size
+                return None
+            with open(filename, "rb") as file_:
+                value = file_.read()
+            os.utime(filename, (now, created))
+        except EnvironmentError:
+            return None
+        return value
+
+    def set(self, key, value):
+        filename = self._filename(key)
+        # Write the result to a temporary file first, so that readers never
+        # see a partial result.
+        temp_filename = "%s.%d.tmp" % (filename, os.getpid())
+        with open(temp_filename, "wb") as file_:
+            file_.write(value)
+        try:
+            self.size -= os.stat(filename).st_size
+        except EnvironmentError:
+            pass
+        os.rename(temp_filename, filename)
+        self.size += len(value)
+        if self.size > self.max_size:
+            self.evict()
+
+    def evict(self):
+        """Remove the least recently used results until the store fits in
+        its budget."""
+        entries = self._entries()
+        size = sum(entry[1] for entry in entries)
+        for accessed, entry_size, name in sorted(entries):
+            if size <= self.max_size:
+                break
+            try:
+                os.unlink(os.path.join(self.path, name))
+            except EnvironmentError:
+                continue
+            size -= entry_size
+        self.size = size
+
+
+class SQLiteStore(object):
+    """Stores results in a SQLite database at `path`."""
+
+    def __init__(self, path, ttl=RESULT_CACHE_TTL,
+                 max_size=RESULT_CACHE_MAX_SIZE):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.db = sqlite3.connect(path)
+        self.db.text_factory = str
+        with self.db:
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                "key TEXT PRIMARY KEY, value BLOB, size INTEGER, "
+                "created REAL, accessed REAL)")
+
+    def get(self, key):
+        now = time.time()
+        row = self.db.execute(
+            "SELECT value, created FROM results WHERE key = ?",
+            (key, )).fetchone()
+        if row is None:
+            return None
+
+        value, created = row
+        with self.db:
+            if expired(self.ttl, created, now):
+                self.db.execute("DELETE FROM results WHERE key = ?", (key, ))
+                return None
+            self.db.execute("UPDATE results SET accessed = ? WHERE key = ?",
+                            (now, key))
+        return str(value)
+
+    def set(self, key, value):
+        now = time.time()
+        with self.db:
+            self.db.execute(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?)",
+                (key, buffer(value), len(value), now, now))
+        self.evict()
+
+    def evict(self):
+        """Remove the least recently used results until the store fits in
+        its budget."""
+        size = self.db.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+        if size <= self.max_size:
+            return
+
+        evicted = []
+        for key, entry_size in self.db.execute(
+                "SELECT key, size FROM results ORDER BY accessed"):
+            if size <= self.max_size:
+                break
+            evicted.append((key, ))
+            size -= entry_size
+
+        with self.db:
+            self.db.executemany("DELETE FROM results WHERE key = ?", evicted)
+
+
+class FindingsCache(object):
+    """
+    Caches the findings of the content tests for single files in a
+    result store. Findings are the serialized state of a bundle spawned to
+    test the file. They are keyed by the content of the file, so the
+    findings for a library are shared by every package that includes it,
+    whatever it is called.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, err, extension, data):
+        """Return the key for a file with the given extension and data."""
+        return cache_key(hash_data(data), type="file", extension=extension,
+                         **artifact_options(err))
+
+    def get(self, key, name):
+        """Return the findings stored under `key`, rewritten for the file
+        `name`, or None."""
+        findings = self.store.get(key)
+        if findings is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        findings = json.loads(findings)
+        id_ = MESSAGE_FIELDS.index("id")
+        for messages in findings["messages"].values():
+            for fields in messages:
+                # JSON turns message IDs into lists.
+                fields[id_] = tuple(fields[id_])
+        return rename_findings(findings, name)
+
+    def set(self, key, findings):
+        """Store the findings for a file."""
+        self.store.set(key, json.dumps(findings))
@@ -117,6 +117,10 @@ class Spec(object):
         """
 
     def iterate(self, branch_name, branch, spec_branch):
+        # In fail-fast mode, nothing more is looked at once an error is found.
+        if self.err.should_halt():
+            return
+
         self.path.append(branch_name)
         self._iterate(branch_name, branch, spec_branch)
         self.path.pop()
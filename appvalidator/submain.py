@@ -6,7 +6,7 @@ from zlib import error as zlib_error
 
 import testcases
 from .webapp import detect_webapp
-from .zip import ZipPackage
+from .zip import DecompressionLimitExceeded, ZipPackage
 
 from constants import *
 
@@ -91,8 +91,20 @@ def test_package(err, file_, name):
         return write_zip_error(err)
 
     try:
+        package.check_limits()
         output = test_inner_package(err, package)
+    except DecompressionLimitExceeded as ex:
+        err.save_resource("interrupted", True)
+        err.error(
+            err_id=("main", "test_package", "decompression_limit"),
+            error="Package is too large to decompress",
+            description=["The package, or a file within it, decompresses to "
+                         "more data than can be validated. Validation was "
+                         "stopped.", str(ex)],
+            filename=ex.filename or "")
+        output = None
     except ValidationTimeout as ex:
+        err.save_resource("interrupted", True)
         err.error(
             err_id=("main", "test_package", "timeout"),
             error="Validation timed out",
@@ -100,7 +112,10 @@ def test_package(err, file_, name):
                          "Contact an Firefox Marketplace reviewer for more "
                          "information.", str(ex)])
         output = None
+    finally:
+        package.close()
 
+    err.metadata["file_cache"] = package.file_cache.stats()
     return output
 
 
@@ -109,6 +124,10 @@ def test_inner_package(err, package):
 
     # Iterate through each tier.
     for tier in sorted(testcases._get_tiers()):
+        if err.max_tier is not None and tier > err.max_tier:
+            # The later tiers never ran, so the result is only partial.
+            err.unfinished = True
+            break
 
         # Let the error bundler know what tier we're on.
         err.set_tier(tier)
@@ -117,8 +136,13 @@ def test_inner_package(err, package):
         try:
             for test in testcases._get_tests(tier):
                 test(err, package)
+                # Stop at the first error if nothing else matters.
+                if err.should_halt():
+                    return err
         except (BadZipfile, zlib_error):
             write_zip_error(err)
+            if err.should_halt():
+                return err
 
         # Return any errors at the end of the tier if undetermined.
         if err.failed(fail_on_warnings=False) and not err.determined:
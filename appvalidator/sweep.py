@@ -0,0 +1,166 @@
+"""
+The archive sweep makes a single streaming pass over the members of a
+package. Each member is decompressed once and its data is fed, chunk by
+chunk, to the consumers that have been registered for it. Tests then look at
+the results of the sweep rather than reading the members themselves.
+"""
+
+import hashlib
+from zipfile import BadZipfile
+import zlib
+
+CHUNK_SIZE = 64 * 1024
+
+SWEEP_CONSUMERS = []
+
+
+def register_consumer(name):
+    """Register a consumer factory for the archive sweep. The factory is
+    called with the package and the info dict of each member, and returns a
+    `Consumer` or None if it isn't interested in that member. The result of
+    the consumer is stored in the sweep results under `name`."""
+
+    def wrap(factory):
+        SWEEP_CONSUMERS.append((name, factory))
+        return factory
+
+    return wrap
+
+
+class Consumer(object):
+    """Receives the data of a member as it is decompressed. A consumer sets
+    `done` once it doesn't need any more data."""
+
+    done = False
+
+    # The number of bytes the consumer still wants, or None if it wants the
+    # whole member. Members are only read as far as their consumers want.
+    wanted = None
+
+    def feed(self, chunk):
+        """Process the next chunk of data. An empty chunk marks the end of
+        the member."""
+        pass
+
+    def finish(self):
+        """Return the result of the consumer."""
+        return None
+
+
+class PrefixConsumer(Consumer):
+    """Collects the first `size` bytes of a member."""
+
+    def __init__(self, size):
+        self.size = size
+        self.data = ""
+
+    @property
+    def wanted(self):
+        return self.size - len(self.data)
+
+    def feed(self, chunk):
+        self.data += chunk[:self.size - len(self.data)]
+        self.done = len(self.data) >= self.size or not chunk
+
+    def finish(self):
+        return self.data
+
+
+class CollectingConsumer(Consumer):
+    """Collects the full data of a member."""
+
+    def __init__(self):
+        self.chunks = []
+
+    def feed(self, chunk):
+        self.chunks.append(chunk)
+        self.done = not chunk
+
+    def finish(self):
+        return "".join(self.chunks)
+
+
+class NormalizedHasher(Consumer):
+    """Computes the sha256 hash of a member as it streams past, with its
+    line endings converted to unix-style. A carriage return at the end of a
+    chunk is held back until the next chunk shows whether it starts a CRLF
+    pair, so the member never needs to be held in memory."""
+
+    def __init__(self):
+        self.hash = hashlib.sha256()
+        self.pending_cr = False
+
+    def feed(self, chunk):
+        if not chunk:
+            if self.pending_cr:
+                self.hash.update("\r")
+            self.pending_cr = False
+            self.done = True
+            return
+
+        if self.pending_cr:
+            chunk = "\r" + chunk
+        self.pending_cr = chunk.endswith("\r")
+        if self.pending_cr:
+            chunk = chunk[:-1]
+        self.hash.update(chunk.replace("\r\n", "\n"))
+
+    def finish(self):
+        return self.hash.hexdigest()
+
+
+def sweep_package(package, chunk_size=CHUNK_SIZE):
+    """Run every registered consumer over the members of a package. Returns
+    a dict mapping each member name to a dict of consumer results. Members
+    which could not be decompressed have their exception stored under
+    "error"."""
+
+    results = {}
+    for name in package:
+        if name not in results:
+            results[name] = sweep_member(package, name, chunk_size)
+    return results
+
+
+def sweep_member(package, name, chunk_size=CHUNK_SIZE):
+    """Run every registered consumer over a single member of a package, and
+    return a dict of their results."""
+
+    info = package.info(name)
+    result = {"error": None}
+
+    consumers = []
+    for consumer_name, factory in SWEEP_CONSUMERS:
+        result[consumer_name] = None
+        consumer = factory(package, info)
+        if consumer is not None:
+            consumers.append((consumer_name, consumer))
+
+    active = [consumer for _, consumer in consumers if not consumer.done]
+    if active:
+        try:
+            stream = package.open(name)
+            try:
+                while active:
+                    wanted = [consumer.wanted for consumer in active]
+                    chunk = stream.read(chunk_size if None in wanted else
+                                        min(chunk_size, max(wanted)))
+                    for consumer in active:
+                        consumer.feed(chunk)
+                    if not chunk:
+                        break
+                    active = [c for c in active if not c.done]
+            finally:
+                stream.close()
+        except (BadZipfile, zlib.error) as exc:
+            # Consumers which didn't get all of the data they wanted have no
+            # result.
+            result["error"] = exc
+            consumers = [(consumer_name, consumer) for
+                         consumer_name, consumer in consumers if
+                         consumer.done or consumer not in active]
+
+    for consumer_name, consumer in consumers:
+        result[consumer_name] = consumer.finish()
+
+    return result
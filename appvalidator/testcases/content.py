@@ -1,4 +1,8 @@
-import hashlib
+import copy
+from collections import defaultdict
+import itertools
+import multiprocessing
+import sys
 
 import markup.csstester as testendpoint_css
 import markup.markuptester as testendpoint_markup
@@ -6,15 +10,127 @@ import scripting as testendpoint_js
 from . import register_test
 from .. import unicodehelper
 from ..constants import *
+from ..errorbundle import ErrorBundle
+from ..fingerprint import blank_regions, FingerprintIndex
+from ..hashindex import HashIndex, index_path, INDEX_NAMES, whitelist_type
+from ..incremental import (artifact_options, comparable_findings,
+                           CONTENT_RESOURCES, IncrementalMismatch)
+from ..resultcache import hash_data, rename_findings
+from ..sweep import (CollectingConsumer, Consumer, NormalizedHasher,
+                     register_consumer, sweep_member)
 
 
 FLAGGED_FILES = set([".DS_Store", "Thumbs.db", "desktop.ini",
                      "_vti_cnf"])
 FLAGGED_EXTENSIONS = set([".orig", ".old", ".tmp", "~"])
 
+# Files with these extensions have their content tested.
+ANALYZED_EXTENSIONS = (".css", ".js", ".xml", ".html", ".xhtml")
 
-with open(os.path.join(os.path.dirname(__file__), "hashes.txt")) as f:
-    hashes_whitelist = set([s.strip().split(None, 1)[0] for s in f])
+# The relative cost of testing a byte of each type of file. JS is parsed and
+# traversed, which is far slower than tokenizing markup or CSS.
+ANALYSIS_COST = {"js": 4, "html": 2, "xhtml": 2, "xml": 2, "css": 1}
+
+
+# The hashes of known libraries, by type of file. The indexes are built from
+# hashes.txt by extras/build_whitelist.py, and are only mapped once a hash is
+# looked up.
+hashes_whitelist = dict(
+    (type_, HashIndex(index_path(os.path.join(os.path.dirname(__file__),
+                                              "hashes"), type_))) for
+    type_ in INDEX_NAMES)
+# The fingerprints of known libraries, which also find libraries that have
+# been modified slightly or bundled with other scripts.
+library_fingerprints = FingerprintIndex(
+    os.path.join(os.path.dirname(__file__), "hashes.json"))
+
+
+def classify_garbage(name, name_lower):
+    """Return "hidden" or "flagged" if the file is garbage, otherwise
+    None."""
+    if "__MACOSX" in name or name_lower[0] in (".", "_", ):
+        return "hidden"
+    elif (any(name.endswith(ext) for ext in FLAGGED_EXTENSIONS) or
+          name in FLAGGED_FILES):
+        return "flagged"
+
+
+def whitelisted_type(name, swept):
+    """Return the type of whitelist a file was found in by its hash, or
+    None if it isn't whitelisted."""
+    type_ = whitelist_type(name)
+    if type_ is not None and swept["sha256"] in hashes_whitelist[type_]:
+        return type_
+
+
+class GarbageClassifier(Consumer):
+    """Classifies garbage files. This only needs the name of the file."""
+
+    done = True
+
+    def __init__(self, info):
+        self.info = info
+
+    def finish(self):
+        return classify_garbage(self.info["name"], self.info["name_lower"])
+
+
+class CacheFiller(CollectingConsumer):
+    """Stores the data of a file in the package's file cache so that it
+    doesn't need to be decompressed again for analysis."""
+
+    def __init__(self, package, name):
+        super(CacheFiller, self).__init__()
+        self.package = package
+        self.name = name
+
+    def finish(self):
+        self.package.file_cache.put(
+            self.name, super(CacheFiller, self).finish())
+        return True
+
+
+@register_consumer("garbage")
+def classify_garbage_files(package, info):
+    return GarbageClassifier(info)
+
+
+@register_consumer("sha256")
+def hash_whitelist_candidates(package, info):
+    if (whitelist_type(info["name"]) is not None and
+            info["name"] not in package.unchanged_files):
+        return NormalizedHasher()
+
+
+@register_consumer("cached")
+def cache_analyzed_files(package, info):
+    # Scripts are only hashed by the sweep so that whitelisted libraries,
+    # which can be large, are never held in memory. The ones that need to be
+    # analyzed are read again later. Stylesheets and markup are small enough
+    # to be cached either way.
+    if (info["name_lower"].endswith(ANALYZED_EXTENSIONS) and
+            info["name"] not in package.unchanged_files and
+            whitelist_type(info["name"]) != "js" and
+            not classify_garbage(info["name"], info["name_lower"])):
+        return CacheFiller(package, info["name"])
+
+
+@register_test(tier=0)
+def test_unchanged_files(err, package=None):
+    """Find the files whose findings can be replayed from the artifact of a
+    previous validation, so that the sweep doesn't decompress them."""
+
+    artifact = err.get_resource("artifact")
+    if not package or not artifact or artifact.verify:
+        # Every file is analyzed in verify mode.
+        return
+
+    # Some of the options, like the type of app, aren't known until the
+    # manifest has been read, so this is only a guess. It is checked by
+    # `test_packed_packages`.
+    package.unchanged_files = set(
+        name for name in package if
+        artifact.unchanged(name, package.info(name)))
 
 
 @register_test(tier=2)
@@ -25,14 +141,43 @@ def test_packed_packages(err, package=None):
 
     processed_files = 0
     garbage_files = 0
+    whitelisted_files = {}
+
+    swept_files = package.sweep()
+    artifact = err.get_resource("artifact") or None
+    if artifact is not None:
+        artifact.begin(artifact_options(err))
+        _sweep_dropped_files(package, swept_files, artifact)
+
+    # Files which share their CRC, size and extension with another file are
+    # probably copies of it. Copies are only analyzed once.
+    copies = defaultdict(int)
+    for name in package:
+        copies[_copy_key(package.info(name))] += 1
+    duplicates = {"candidates": set(key for key, count in
+                                    copies.iteritems() if
+                                    key and count > 1),
+                  "findings": {}}
+
+    # In parallel mode, the files are analyzed up front by a pool of worker
+    # processes. The findings are then merged in the same order as they
+    # would have been found in serial mode.
+    analyzed = {}
+    workers = err.get_resource("workers")
+    if workers > 1:
+        analyzed = _analyze_in_pool(err, package, swept_files, artifact,
+                                    workers)
 
     # Iterate each item in the package.
     for name in package:
+        if err.should_halt():
+            break
+
         file_info = package.info(name)
-        file_name = file_info["name_lower"]
         file_size = file_info["size"]
+        swept = swept_files[name]
 
-        if "__MACOSX" in name or file_name[0] in (".", "_", ):
+        if swept["garbage"] == "hidden":
             err.warning(
                 err_id=("testcases_content", "test_packed_packages",
                         "hidden_files"),
@@ -45,8 +190,7 @@ def test_packed_packages(err, package=None):
                 filename=name)
             garbage_files += file_size
             continue
-        elif (any(name.endswith(ext) for ext in FLAGGED_EXTENSIONS) or
-              name in FLAGGED_FILES):
+        elif swept["garbage"] == "flagged":
             err.warning(
                 err_id=("testcases_content", "test_packaged_packages",
                         "flagged_files"),
@@ -58,21 +202,40 @@ def test_packed_packages(err, package=None):
             garbage_files += file_size
             continue
 
-        # Read the file from the archive if possible.
-        file_data = u""
-        try:
-            file_data = package.read(name)
-        except KeyError:
-            pass
+        reused = None
+        if artifact is not None:
+            reused = artifact.lookup(name, file_info)
+
+        if reused is None or artifact.verify:
+            whitelisted = whitelisted_type(name, swept)
+            if whitelisted:
+                # Skip over whitelisted hashes.
+                processed, findings = None, None
+            else:
+                processed, findings = _test_file(err, package, name,
+                                                 file_info, swept,
+                                                 duplicates, analyzed)
+            if reused is not None and (
+                    reused[0] != processed or reused[2] != whitelisted or
+                    comparable_findings(reused[1]) !=
+                        comparable_findings(findings)):
+                raise IncrementalMismatch(name)
+        else:
+            # Unchanged files aren't hashed by the sweep, so whether they are
+            # whitelisted is replayed with their findings.
+            processed, findings, whitelisted = reused
 
-        # Skip over whitelisted hashes - only applies to .js files for now.
-        if name.endswith('.js'):
-            file_data = file_data.replace("\r\n", "\n")
-            if hashlib.sha256(file_data).hexdigest() in hashes_whitelist:
-                continue
+        if whitelisted:
+            stats = whitelisted_files.setdefault(whitelisted,
+                                                 {"files": 0, "size": 0})
+            stats["files"] += 1
+            stats["size"] += file_size
+        if findings is not None:
+            err.merge(findings)
+        if artifact is not None:
+            artifact.record(name, file_info, processed, findings,
+                            whitelisted)
 
-        # Process the file.
-        processed = _process_file(err, package, name, file_data)
         # If the file is processed, it will return True. If the process goes
         # badly, it will return False. If the processing is skipped, it returns
         # None. We should respect that.
@@ -82,6 +245,11 @@ def test_packed_packages(err, package=None):
         # This aids in creating unit tests.
         processed_files += 1
 
+    if artifact is not None:
+        artifact.finish(artifact_options(err))
+    if whitelisted_files:
+        err.metadata["whitelisted_files"] = whitelisted_files
+
     if garbage_files >= MAX_GARBAGE:
         err.error(
             err_id=("testcases_content", "garbage"),
@@ -95,31 +263,290 @@ def test_packed_packages(err, package=None):
     return processed_files
 
 
+def _sweep_dropped_files(package, swept_files, artifact):
+    """Sweep the files that were thought to be unchanged, but whose findings
+    were dropped because the options of the validation have changed. The
+    sweep skipped them, so they haven't been hashed or cached."""
+
+    dropped = set(name for name in package.unchanged_files if
+                  not artifact.unchanged(name, package.info(name)))
+    if not dropped:
+        return
+
+    package.unchanged_files -= dropped
+    for name in dropped:
+        swept_files[name] = sweep_member(package, name)
+
+
+def _copy_key(file_info):
+    """Return the key used to find copies of a file in a package."""
+    if "crc" in file_info:
+        return (file_info["crc"], file_info["size"], file_info["extension"])
+
+
+def _test_file(err, package, name, file_info, swept, duplicates=None,
+               analyzed=None):
+    """Run the content tests on a file. Returns the result of
+    `_process_file` and the findings of the tests: the serialized state of a
+    bundle spawned from `err`, or None if the tests found nothing. When the
+    file is a copy of one that has already been tested, confirmed by its
+    hash, the findings for that file are replicated instead. Files which
+    have been analyzed by worker processes have their findings in
+    `analyzed`."""
+
+    if analyzed and name in analyzed:
+        return True, analyzed[name]
+
+    file_data = _read_file(package, name, file_info)
+
+    copy_key = None
+    if duplicates and _copy_key(file_info) in duplicates["candidates"]:
+        copy_key = _copy_key(file_info) + (hash_data(file_data), )
+        if copy_key in duplicates["findings"]:
+            processed, findings = duplicates["findings"][copy_key]
+            if findings is not None:
+                findings = rename_findings(copy.deepcopy(findings), name)
+            return processed, findings
+
+    # Process the file.
+    child = err.spawn()
+    processed = _process_file(child, package, name, file_data)
+    findings = _get_findings(child, err.tier)
+
+    if copy_key is not None:
+        duplicates["findings"][copy_key] = processed, findings
+    return processed, findings
+
+
+def _read_file(package, name, file_info):
+    """Read the text of a file whose content is tested."""
+
+    # Read the file from the archive if possible. Only files whose
+    # content is tested need to be read.
+    file_data = u""
+    if file_info["name_lower"].endswith(ANALYZED_EXTENSIONS):
+        try:
+            file_data = package.read_text(name)
+        except KeyError:
+            pass
+
+    if name.endswith('.js'):
+        file_data = file_data.replace("\r\n", "\n")
+    return file_data
+
+
+def _get_findings(child, tier):
+    """Return the serialized state of a spawned bundle, or None if the tests
+    that were run in it found nothing."""
+    if (child.message_count or child.metadata or child.feature_profile or
+            child.ending_tier != tier):
+        return child.serialize()
+
+
+def _analyze_in_pool(err, package, swept_files, artifact, workers):
+    """Analyze the files of a package which need their content tested in a
+    pool of worker processes. Returns a dict mapping the name of each
+    analyzed file to its findings. Files whose findings will be reused or
+    replicated in the serial pass are only analyzed once. In fail-fast mode,
+    the pool is stopped once a file has an error, and the files that weren't
+    analyzed are left to the serial pass."""
+
+    findings_cache = err.get_resource("findings_cache")
+    options = artifact_options(err)
+
+    # The most expensive files are handed out first, and each worker takes
+    # the next file as soon as it is free, so that one large file at the end
+    # of the package doesn't leave the other workers idle.
+    candidates = []
+    for name in package:
+        file_info = package.info(name)
+        swept = swept_files[name]
+        if (swept["garbage"] or whitelisted_type(name, swept) or
+                not file_info["name_lower"].endswith(ANALYZED_EXTENSIONS) or
+                artifact is not None and not artifact.verify and
+                artifact.unchanged(name, file_info)):
+            continue
+        candidates.append((_estimate_cost(file_info), name, file_info))
+    candidates.sort(key=lambda candidate: candidate[0], reverse=True)
+
+    analyzed = {}
+    keys = {}
+    copies = defaultdict(list)
+    errors = []
+
+    def jobs():
+        """Yield the job for each file that has to be analyzed. Files are
+        read as the pool takes them, so only the files that are queued for
+        the workers are held in memory."""
+        try:
+            for cost, name, file_info in candidates:
+                file_data = _read_file(package, name, file_info)
+                if not file_data:
+                    continue
+
+                extension = name.lower().split(".")[-1]
+                copy_key = extension, hash_data(file_data)
+                copies[copy_key].append(name)
+                if len(copies[copy_key]) > 1:
+                    continue
+
+                if findings_cache:
+                    key = findings_cache.key(err, extension, file_data)
+                    findings = findings_cache.get(key, name)
+                    if findings is not None:
+                        analyzed[name] = findings
+                        continue
+                    keys[name] = key
+
+                yield (name, file_info["extension"], file_data,
+                       package.encodings.get(name), err.tier, options)
+        except Exception:
+            # The pool would swallow the exception, so it is raised again
+            # once the pool has stopped.
+            errors.append(sys.exc_info())
+
+    pending = jobs()
+    first = next(pending, None)
+    if first is not None:
+        pool = multiprocessing.Pool(workers)
+        try:
+            results = pool.imap_unordered(_analyze_in_worker,
+                                          itertools.chain([first], pending))
+            while True:
+                try:
+                    # Waiting with a timeout lets the validation timeout
+                    # interrupt the wait.
+                    name, findings = results.next(sys.maxint)
+                except StopIteration:
+                    break
+                analyzed[name] = findings
+                if (err.fail_fast and findings and
+                        findings["messages"]["errors"]):
+                    break
+            pool.close()
+        finally:
+            pool.terminate()
+            pool.join()
+    if errors:
+        raise errors[0][0], errors[0][1], errors[0][2]
+
+    for name, key in keys.items():
+        if name in analyzed:
+            findings_cache.set(
+                key, analyzed[name] or err.spawn().serialize())
+
+    for names in copies.values():
+        if names[0] not in analyzed:
+            continue
+        findings = analyzed[names[0]]
+        for name in names[1:]:
+            analyzed[name] = (findings and
+                              rename_findings(copy.deepcopy(findings), name))
+
+    return analyzed
+
+
+def _estimate_cost(file_info):
+    """Estimate the cost of testing a file from its size and type."""
+    return file_info["size"] * ANALYSIS_COST.get(file_info["extension"], 1)
+
+
+def _analyze_in_worker(job):
+    """Run the content tests on a file in a worker process, in a bundle set
+    up with the options of the validation. Returns the name of the file and
+    the findings of the tests."""
+    name, extension, file_data, detected, tier, options = job
+
+    err = ErrorBundle()
+    for resource in CONTENT_RESOURCES:
+        err.save_resource(resource, options[resource])
+    err.set_tier(tier)
+
+    child = err.spawn()
+    _run_content_tests(child, name, extension, file_data, detected)
+    return name, _get_findings(child, tier)
+
+
 def _process_file(err, package, name, file_data):
     """Process a single file's content tests."""
 
     name_lower = name.lower()
 
-    if not name_lower.endswith((".css", ".js", ".xml", ".html", ".xhtml")):
+    if not name_lower.endswith(ANALYZED_EXTENSIONS):
         return False
 
     if not file_data:
         return None
 
+    extension = package.info(name)["extension"]
+    detected = package.encodings.get(name)
+    findings_cache = err.get_resource("findings_cache")
+    if not findings_cache:
+        _run_content_tests(err, name, extension, file_data, detected)
+        return True
+
+    key = findings_cache.key(err, name_lower.split(".")[-1], file_data)
+    findings = findings_cache.get(key, name)
+    if findings is None:
+        child = err.spawn()
+        _run_content_tests(child, name, extension, file_data, detected)
+        findings = child.serialize()
+        findings_cache.set(key, findings)
+    err.merge(findings)
+    return True
+
+
+def _run_content_tests(err, name, extension, file_data, detected=None):
+    """Run the tests for the type of a file on its content. If the file has
+    already been decoded, `detected` holds the encoding it was decoded from
+    and the confidence of the detection."""
+
+    name_lower = name.lower()
+
     # Convert the file data to unicode
-    file_data = unicodehelper.decode(file_data)
+    if detected is None:
+        file_data, encoding, confidence = unicodehelper.detect_and_decode(
+            file_data)
+    else:
+        encoding, confidence = detected
+    if confidence is not None and confidence < 1:
+        # Only the files whose encoding is in doubt are listed.
+        err.metadata.setdefault("encodings", {})[name] = {
+            "encoding": encoding, "confidence": confidence}
 
     if name_lower.endswith(".css"):
         testendpoint_css.test_css_file(err, name, file_data)
 
     elif name_lower.endswith(".js"):
-        testendpoint_js.test_js_file(err, name, file_data)
+        file_data = _exclude_libraries(err, name, file_data)
+        if file_data is not None:
+            testendpoint_js.test_js_file(err, name, file_data)
 
     elif name_lower.endswith((".xml", ".html", ".xhtml")):
         p = testendpoint_markup.MarkupParser(err)
-        p.process(name, file_data, package.info(name)["extension"])
+        p.process(name, file_data, extension)
 
-    return True
+
+def _exclude_libraries(err, name, file_data):
+    """Find the known libraries in a script and list them in the metadata.
+    Returns the script with the libraries blanked out, or None if the script
+    is a known library in its entirety."""
+
+    # Scripts which are too large for the JS tests are skipped by them
+    # whether or not they bundle libraries, so they are only recognized if
+    # they are a library in their entirety.
+    libraries = library_fingerprints.find(
+        file_data, bundles=len(file_data) <= testendpoint_js.MAX_JS_SIZE)
+    if not libraries:
+        return file_data
+
+    err.metadata.setdefault("libraries", {})[name] = [
+        {"name": library.name, "version": library.version} for
+        library, start, end in libraries]
+    if libraries[0][1:] == (0, len(file_data)):
+        return None
+    return blank_regions(file_data,
+                         [(start, end) for library, start, end in libraries])
 
 
 @register_test(tier=2)
@@ -3,7 +3,7 @@ import subprocess
 
 import json
 
-from appvalidator.contextgenerator import ContextGenerator
+from appvalidator.contextgenerator import get_context_generator
 import appvalidator.unicodehelper as unicodehelper
 
 JS_ESCAPE = re.compile("\\\\+[ux]", re.I)
@@ -28,7 +28,7 @@ def get_tree(code, err=None, filename=None, shell_noop=None):
                              "Message: %s" % str_exc.split(":", 1)[-1].strip()],
                 filename=filename,
                 line=exc.line,
-                context=ContextGenerator(code))
+                context=get_context_generator(code, err))
         elif "InternalError: too much recursion" in str_exc:
             err.notice(
                 err_id=("testcases_scripting", "test_js_file",
@@ -5,7 +5,7 @@ from tempfile import NamedTemporaryFile
 import json
 
 from appvalidator.constants import SPIDERMONKEY_INSTALLATION
-from appvalidator.contextgenerator import ContextGenerator
+from appvalidator.contextgenerator import get_context_generator
 import appvalidator.unicodehelper as unicodehelper
 
 JS_ESCAPE = re.compile("\\\\+[ux]", re.I)
@@ -31,7 +31,7 @@ def get_tree(code, err=None, filename=None, shell=None):
                              ],
                 filename=filename,
                 line=exc.line,
-                context=ContextGenerator(code))
+                context=get_context_generator(code, err))
         elif "InternalError: too much recursion" in str_exc:
             err.notice(
                 err_id=("testcases_scripting", "test_js_file",
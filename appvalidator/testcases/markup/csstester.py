@@ -1,20 +1,132 @@
 import re
-import fnmatch
+from bisect import bisect_right
+
 import cssutils
 
-from appvalidator.contextgenerator import ContextGenerator
+from appvalidator.contextgenerator import get_context_generator
 
-BAD_URL_PAT = "url\(['\"]?(?!(chrome:|resource:))(\/\/|(ht|f)tps?:\/\/|data:)[a-z0-9\/\-\.#]*['\"]?\)"
+# A url() reference to a remote resource.
+BAD_URL_PAT = r"url\(\s*['\"]?((ht|f)tps?:)?//"
 BAD_URL = re.compile(BAD_URL_PAT, re.I)
 
+# CSS is tested in a single pass over this pattern. Comments and strings are
+# matched so that nothing within them is mistaken for a url() reference.
+SCANNER = re.compile(r"""
+    /\*.*?(?:\*/|\Z)
+  | "(?:[^"\\\n]|\\.)*"
+  | '(?:[^'\\\n]|\\.)*'
+  | (?P<url>url\(\s*(?:"[^"\n]*"|'[^'\n]*'|[^'")\s]*)\s*\))
+""", re.I | re.S | re.X)
+
+# The cssutils tokenizer can't handle control or non-ASCII characters.
+TOKENIZER_DELETE = "".join(chr(i) for i in range(256) if not 8 < i < 127)
+
+# Separates the style attributes of a document when they are tested
+# together. It closes any comment that an attribute leaves open.
+SNIPPET_SEPARATOR = "\n*/\n"
+
 
 def test_css_file(err, filename, data, line_start=1):
     "Parse and test a whole CSS file."
 
+    context = None
+    for position, url in _remote_urls(data):
+        # The line index is only built once something has been found.
+        if context is None:
+            context = get_context_generator(data, err)
+        line = context.get_line(position)
+        _report_remote_url(err, filename, url, line_start - 1 + line,
+                           context.get_context(line=line))
+
+    # Tokenizing the CSS is much slower than scanning it, and only turns up
+    # characters the tokenizer can't decode, so it is only done on request.
+    if err.get_resource("css_tokenize"):
+        _tokenize_css(err, filename, data, line_start)
+
+
+def test_css_snippet(err, filename, data, line):
+    "Parse and test a CSS nugget."
+
+    test_css_snippets(err, filename, [(data, line)])
+
+
+def test_css_snippets(err, filename, snippets, context=None):
+    """Test the CSS nuggets of a markup document, such as its style
+    attributes, in a single pass. `snippets` is a list of (CSS, line) pairs,
+    and findings are reported on the line of the snippet they are found in.
+    `context` is the context generator of the document, if there is one."""
+
+    if not snippets:
+        return
+
+    # The line of the batch that each snippet starts on.
+    starts = []
+    batch_line = 1
+    for data, line in snippets:
+        starts.append(batch_line)
+        batch_line += data.count("\n") + 2
+    batch = SNIPPET_SEPARATOR.join(data for data, line in snippets)
+
+    def document_line(batch_line):
+        """Return the line of the document that a line of the batch is
+        on."""
+        index = bisect_right(starts, batch_line) - 1
+        return snippets[index][1] + batch_line - starts[index]
+
+    batch_context = None
+    for position, url in _remote_urls(batch):
+        if batch_context is None:
+            batch_context = get_context_generator(batch, err)
+        batch_line = batch_context.get_line(position)
+        line = document_line(batch_line)
+        _report_remote_url(
+            err, filename, url, line,
+            context.get_context(line=line) if context else
+            batch_context.get_context(line=batch_line))
+
+    # The batch is tokenized once, like it is scanned.
+    if err.get_resource("css_tokenize"):
+        _tokenize_css(err, filename, batch, line_map=document_line)
+
+
+def _remote_urls(data):
+    """Yield the position and text of each remote url() reference in CSS.
+    The CSS is scanned in a single pass over the scanner pattern, and only
+    the url() references are looked at more closely, so the cost of the
+    scan is linear in the size of the CSS."""
+
+    for match in SCANNER.finditer(data):
+        url = match.group("url")
+        if url is not None and BAD_URL.match(url):
+            yield match.start(), url
+
+
+def _report_remote_url(err, filename, url, line, context):
+    err.notice(
+        err_id=("testcases_markup_csstester", "test_css_file", "remote_url"),
+        notice="Remote resource referenced from CSS",
+        description=["A remote resource is referenced with url(). It won't "
+                     "be available while the device is offline, so it "
+                     "should be included in the package instead.",
+                     "Reference: %s" % url],
+        filename=filename,
+        line=line,
+        context=context)
+
+
+def _tokenize_css(err, filename, data, line_start=1, line_map=None):
+    """Run the CSS through the cssutils tokenizer. The lines of the CSS are
+    reported relative to `line_start`, or mapped to the lines they are
+    reported on by the function `line_map`."""
+
+    if line_map is None:
+        line_map = lambda line: line + line_start - 1
+
     tokenizer = cssutils.tokenize2.Tokenizer()
-    context = ContextGenerator(data)
 
-    data = "".join(c for c in data if 8 < ord(c) < 127)
+    if isinstance(data, unicode):
+        data = data.encode("ascii", "ignore")
+    data = data.translate(None, TOKENIZER_DELETE)
 
     token_generator = tokenizer.tokenize(data)
 
@@ -22,8 +134,7 @@ def test_css_file(err, filename, data, line_start=1):
         _run_css_tests(err,
                        tokens=token_generator,
                        filename=filename,
-                       line_start=line_start - 1,
-                       context=context)
+                       line_map=line_map)
     except:  # pragma: no cover
         # This happens because tokenize is a generator.
         # Bravo, Mr. Bond, Bravo.
@@ -37,25 +148,11 @@ def test_css_file(err, filename, data, line_start=1):
         return
 
 
-def test_css_snippet(err, filename, data, line):
-    "Parse and test a CSS nugget."
-
-    # Re-package to make it CSS-complete. Note the whitespace to prevent
-    # the extra code from showing in the context output.
-    data = "#foo{\n\n%s\n\n}" % data
-
-    test_css_file(err, filename, data, line)
+def _run_css_tests(err, tokens, filename, line_map):
+    """Drain the tokens of a CSS file, noting the lines which the tokenizer
+    could not decode. `line_map` maps the line of a token to the line it is
+    reported on."""
 
-
-def _run_css_tests(err, tokens, filename, line_start=0, context=None):
-    """Processes a CSS file to test it for things that could cause it
-    to be harmful to the browser."""
-
-    last_descriptor = None
-
-    skip_types = ("S", "COMMENT")
-
-    identity_box_mods = []
     unicode_errors = []
 
     while True:
@@ -63,18 +160,10 @@ def _run_css_tests(err, tokens, filename, line_start=0, context=None):
         try:
             (tok_type, value, line, position) = tokens.next()
         except UnicodeDecodeError:
-            unicode_errors.append(str(line + line_start))
+            unicode_errors.append(str(line_map(line)))
             continue
         except StopIteration:
             break
-        except Exception, e:
-            # Comment me out for debug!
-            raise
-
-            print type(e), e
-            print filename
-            print line + line_start
-            continue
 
     if unicode_errors:
         err.info(("testcases_markup_csstester",
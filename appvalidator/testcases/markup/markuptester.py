@@ -4,7 +4,7 @@ import types
 
 import appvalidator.unicodehelper as unicodehelper
 from . import csstester
-from appvalidator.contextgenerator import ContextGenerator
+from appvalidator.contextgenerator import get_context_generator
 from appvalidator.constants import *
 from appvalidator.csp import warn as message_csp
 from appvalidator.python.HTMLParser import HTMLParser, HTMLParseError
@@ -17,6 +17,10 @@ SELF_CLOSING_TAGS = ("area", "base", "basefont", "br", "col", "frame", "hr",
                      "img", "input", "li", "link", "meta", "p", "param", )
 TAG_NOT_OPENED = "Tag (%s) being closed before it is opened."
 REMOTE_URL_PATTERN = re.compile("((ht|f)tps?:)?//")
+# An attribute of a start tag, with its value. Matching whole attributes
+# keeps the text within quoted values from being taken for attributes.
+ATTRIBUTE = re.compile(r"""\s+([^\s"'<>/=]+)"""
+                       r"""(?:\s*=\s*(?:"[^"]*"|'[^']*'|[^\s"'>]*))?""")
 
 DOM_MUTATION_HANDLERS = set([
         "ondomattrmodified", "ondomattributenamechanged",
@@ -41,6 +45,7 @@ class MarkupParser(HTMLParser):
         self.xml_state = []
         self.xml_line_stack = []
         self.xml_buffer = []
+        self.style_snippets = []
 
         self.reported = set()
 
@@ -54,14 +59,13 @@ class MarkupParser(HTMLParser):
         self.extension = extension.lower()
 
         self.reported = set()
+        self.style_snippets = []
 
-        self.context = ContextGenerator(data)
-
-        lines = data.split("\n")
+        self.context = get_context_generator(data, self.err)
 
         buffering = False
         pline = 0
-        for line in lines:
+        for line in self.context.data:
             self.line += 1
 
             search_line = line
@@ -96,6 +100,10 @@ class MarkupParser(HTMLParser):
             else:
                 self._feed_parser(search_line)
 
+        # The style attributes of the document are tested together.
+        csstester.test_css_snippets(self.err, self.filename,
+                                    self.style_snippets, self.context)
+
     def _feed_parser(self, line):
         """Feed incoming data into the underlying HTMLParser."""
 
@@ -164,8 +172,15 @@ class MarkupParser(HTMLParser):
         attr_dict = dict([(a[0].lower(), a[1]) for a in attrs if a[1]])
 
         if "style" in attr_dict:
-            csstester.test_css_snippet(
-                self.err, self.filename, attr_dict["style"], self.line)
+            # The tag may span several lines, so find the line that the
+            # style attribute starts on.
+            tag_text = self.get_starttag_text() or ""
+            line = self.line - tag_text.count("\n")
+            for attribute in ATTRIBUTE.finditer(tag_text):
+                if attribute.group(1).lower() == "style":
+                    line += tag_text.count("\n", 0, attribute.start(1))
+                    break
+            self.style_snippets.append((attr_dict["style"], line))
 
         event_attribute = lambda k: k.startswith("on") and "-" not in k
         script_attributes = dict(
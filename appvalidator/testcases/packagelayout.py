@@ -1,6 +1,7 @@
-import zlib
+from zipfile import BadZipfile
 
 from . import register_test
+from ..sweep import PrefixConsumer, register_consumer
 
 # Detect blacklisted files based on their extension.
 blacklisted_extensions = ("dll", "exe", "dylib", "so", "sh", "class")
@@ -17,12 +18,32 @@ blacklisted_magic_numbers = (
         (0x43, 0x57, 0x53),  # ZLIB compressed SWF
 )
 
+# The longest magic number is four bytes.
+MAGIC_LENGTH = 4
+
 VC_DIRS = (".git", ".svn", )
 
 
-@register_test(tier=1)
+@register_consumer("magic")
+def sniff_magic_number(package, info):
+    """Collect the leading bytes of each member for the magic number test."""
+    return PrefixConsumer(MAGIC_LENGTH)
+
+
+def _has_invalid_name(file_):
+    return (file_["name_lower"].startswith(" ") or
+            file_["name_lower"].endswith(" "))
+
+
+def _is_version_controlled(name):
+    return any(x in VC_DIRS for x in name.lower().split("/"))
+
+
+@register_test(tier=0)
 def test_blacklisted_files(err, package=None):
-    "Detects blacklisted files and extensions."
+    """Detects blacklisted files and extensions. Only the names of the files
+    are needed, so this runs on the central directory before any file is
+    decompressed."""
 
     if not package:
         return
@@ -33,8 +54,7 @@ def test_blacklisted_files(err, package=None):
     for name in package:
         file_ = package.info(name)
 
-        if (file_["name_lower"].startswith(" ") or
-            file_["name_lower"].endswith(" ")):
+        if _has_invalid_name(file_):
             err.error(
                 err_id=("packagelayout", "invalid_name"),
                 error="Filename starts with or ends with invalid character.",
@@ -53,7 +73,7 @@ def test_blacklisted_files(err, package=None):
             flagged_files.append(name)
             continue
 
-        if any(x in VC_DIRS for x in name.lower().split("/")):
+        if _is_version_controlled(name):
             if flagged_for_vc:
                 continue
 
@@ -69,13 +89,42 @@ def test_blacklisted_files(err, package=None):
                 filename=name)
             continue
 
+    if flagged_files:
+        err.warning(
+            err_id=("testcases_packagelayout", "test_blacklisted_files",
+                    "disallowed_extension"),
+            warning="Flagged file extensions found.",
+            description=["Files whose names end with flagged extensions have "
+                         "been found in the app.",
+                         "The extension of these files are flagged because "
+                         "they usually identify binary components, which can "
+                         "contain malware.", "\n".join(flagged_files)])
+
+
+@register_test(tier=1)
+def test_magic_numbers(err, package=None):
+    "Detects files whose content is a blacklisted binary format."
+
+    if not package:
+        return
+
+    for name in package:
+        file_ = package.info(name)
+
+        # Files which were flagged by their names have already been
+        # reported.
+        if (_has_invalid_name(file_) or
+                file_["extension"] in blacklisted_extensions or
+                _is_version_controlled(name)):
+            continue
+
         # Perform a deep inspection to detect magic numbers for known binary
         # and executable file types.
-        try:
-            z = package.zf.open(name)
-            bytes = tuple(map(ord, z.read(4)))  # Longest is 4 bytes
-            z.close()
-        except zlib.error:
+        swept = package.sweep()[name]
+        if isinstance(swept["error"], BadZipfile):
+            # Let the corrupt ZIP be reported like any other.
+            raise swept["error"]
+        elif swept["error"]:
             # Tell the zip that there's a broken file.
             package.broken_files.add(name)
             return err.error(
@@ -86,6 +135,7 @@ def test_blacklisted_files(err, package=None):
                             "be successfully unzipped.",
                 filename=name)
 
+        bytes = tuple(map(ord, swept["magic"]))
         if any(bytes[0:len(x)] == x for x in blacklisted_magic_numbers):
             # Note that there is binary content in the metadata
             err.metadata["contains_binary_content"] = True
@@ -100,19 +150,8 @@ def test_blacklisted_files(err, package=None):
                                  name],
                 filename=name)
 
-    if flagged_files:
-        err.warning(
-            err_id=("testcases_packagelayout", "test_blacklisted_files",
-                    "disallowed_extension"),
-            warning="Flagged file extensions found.",
-            description=["Files whose names end with flagged extensions have "
-                         "been found in the app.",
-                         "The extension of these files are flagged because "
-                         "they usually identify binary components, which can "
-                         "contain malware.", "\n".join(flagged_files)])
 
-
-@register_test(tier=1)
+@register_test(tier=0)
 def test_layout_all(err, package):
     """Tests the well-formedness of apps."""
 
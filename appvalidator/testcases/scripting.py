@@ -2,14 +2,17 @@ import javascript.traverser as traverser
 import javascript.acorn as acorn
 import javascript.spidermonkey as spidermonkey
 from appvalidator.constants import SPIDERMONKEY_INSTALLATION
-from ..contextgenerator import ContextGenerator
+from ..contextgenerator import get_context_generator
+
+# Scripts larger than this aren't tested.
+MAX_JS_SIZE = 1024 * 1024
 
 
 def test_js_file(err, filename, data, line=0, context=None):
     "Tests a JS file by parsing and analyzing its tokens"
 
     # Don't even try to run files bigger than 1MB.
-    if len(data) > 1024 * 1024:
+    if len(data) > MAX_JS_SIZE:
         err.warning(
             err_id=("js", "skip", "didnt_even_try"),
             warning="Didn't even try to validate large JS file.",
@@ -51,7 +54,7 @@ def test_js_file(err, filename, data, line=0, context=None):
         return
 
     trav = traverser.Traverser(
-        err, filename, line, context=context or ContextGenerator(data))
+        err, filename, line, context=context or get_context_generator(data, err))
     trav.run(tree)
 
     err.metadata["ran_js_tests"] = "yes"
@@ -18,22 +18,36 @@ HEADERS = {
 }
 
 
-@register_test(tier=1)
-def test_app_manifest(err, package):
+@register_test(tier=0)
+def test_manifest_exists(err, package):
+    """Check the central directory for the manifest before anything is
+    decompressed."""
 
     if not err.get_resource("packaged"):
         # This is done by the validate_*() functions.
         return
 
     if "manifest.webapp" not in package:
-        return err.error(
+        err.error(
             err_id=("webappbase", "test_app_manifest", "missing_manifest"),
             error="Packaged app missing manifest",
             description=["All apps must contain an app manifest file.",
                          "Attempted to find a manifest at `/manifest.webapp`, "
                          "but no file was found."])
 
-    webapp = detect_webapp_string(err, package.read("manifest.webapp"))
+
+@register_test(tier=1)
+def test_app_manifest(err, package):
+
+    if not err.get_resource("packaged"):
+        # This is done by the validate_*() functions.
+        return
+
+    # A missing manifest is reported by `test_manifest_exists`.
+    if "manifest.webapp" not in package:
+        return
+
+    webapp = detect_webapp_string(err, package.read_text("manifest.webapp"))
     err.save_resource("manifest", webapp)
     if webapp:
         err.save_resource("app_type", str(webapp.get("type", "web")).lower())
@@ -157,6 +171,11 @@ def try_get_resource(err, package, url, filename, resource_type="URL",
         if err.get_resource("packaged"):
             url = url.lstrip("/")
             try:
+                if binary:
+                    # Stored members can be handed out without copying.
+                    view = package.view(url)
+                    if view is not None:
+                        return view
                 return package.read(url)
             except Exception:
                 err.error(
@@ -12,7 +12,18 @@ def is_standard_ascii(x):
     return not (is_ctrl_char(x, y) or y > 126)
 
 
+# Maps each byte to itself if it is standard ASCII, or to "?" otherwise.
+ASCII_FILTER = "".join((chr(i) if is_standard_ascii(chr(i)) else "?") for
+                       i in range(256))
+
+
+# Nothing in the validator calls this since unicodehelper.decode stopped
+# filtering the text it returns. It is kept for external callers.
 def filter_ascii(text):
+    "Replaces every character that isn't standard ASCII with a question mark"
     if isinstance(text, list):
         return [filter_ascii(x) for x in text]
-    return "".join((x if is_standard_ascii(x) else "?") for x in text)
+    if isinstance(text, unicode):
+        # The codec replaces the characters beyond ASCII.
+        return unicode(text.encode("ascii", "replace").translate(ASCII_FILTER))
+    return text.translate(ASCII_FILTER)
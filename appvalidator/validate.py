@@ -1,14 +1,16 @@
 import json
+import os
 
 import constants
 import loader
+import resultcache
 import submain
 import webapp
 from errorbundle import ErrorBundle
 
 
 def validate_app(data, listed=True, market_urls=None, url=None,
-                 format="json", acorn=False):
+                 format="json", acorn=False, fail_fast=False, cache=None):
     """
     A handy function for validating apps.
 
@@ -23,25 +25,48 @@ def validate_app(data, listed=True, market_urls=None, url=None,
         The URL of the manifest. Used to resolve non-absolute URLs.
     `format`:
         The output format to return the results in.
+    `fail_fast`:
+        Stop validating as soon as an error is found. The result is marked as
+        partial when validation stops early.
+    `cache`:
+        A result store, such as a `resultcache.FileSystemStore`, to look the
+        result up in and to store it in. Only JSON results are cached.
 
     Notes:
     - App validation is always determined because there is only one tier.
     - Spidermonkey paths are not accepted by this function because we don't
       perform JavaScript validation on webapps.
     """
-    bundle = ErrorBundle(listed=listed)
+    key = None
+    if cache is not None and format == "json":
+        key = resultcache.cache_key(
+            resultcache.hash_data(data), type="app", listed=listed,
+            market_urls=market_urls, url=url, acorn=acorn,
+            fail_fast=fail_fast)
+        output = cache.get(key)
+        if output is not None:
+            return output
+
+    bundle = ErrorBundle(listed=listed, fail_fast=fail_fast)
     bundle.save_resource("market_urls", market_urls)
     bundle.save_resource("manifest_url", url)
     bundle.save_resource("acorn", acorn)
 
     webapp.detect_webapp_string(bundle, data)
-    submain.test_inner_package(bundle, None)
+    if not bundle.should_halt():
+        submain.test_inner_package(bundle, None)
 
-    return format_result(bundle, format)
+    output = format_result(bundle, format)
+    if key is not None:
+        cache.set(key, output)
+    return output
 
 
 def validate_packaged_app(path, listed=True, format="json", market_urls=None,
-                          timeout=None, spidermonkey=False, acorn=False):
+                          timeout=None, spidermonkey=False, acorn=False,
+                          fail_fast=False, prescreen_only=False, cache=None,
+                          artifact=None, findings_cache=None, workers=None,
+                          css_tokenize=False):
     """
     A handy function for validating apps.
 
@@ -62,16 +87,73 @@ def validate_packaged_app(path, listed=True, format="json", market_urls=None,
         uses the validator's built-in detection of Spidermonkey. Specifying
         `None` will disable JavaScript tests. Any other value is treated as the
         path.
+    `fail_fast`:
+        Stop validating as soon as an error is found. The result is marked as
+        partial when validation stops early. Problems that are found in the
+        ZIP central directory stop validation before any file is
+        decompressed.
+    `prescreen_only`:
+        Only run the pre-screen tests, which look at nothing but the ZIP
+        central directory. The result is marked as partial.
+    `cache`:
+        A result store, such as a `resultcache.FileSystemStore`, to look the
+        result up in and to store it in. Only JSON results are cached, and
+        only if validation wasn't stopped by a timeout or the decompression
+        limit.
+    `artifact`:
+        An `incremental.Artifact` holding the findings of a previous version
+        of the package. The findings of files that haven't changed are reused,
+        and the artifact is updated with the findings of this validation.
+    `findings_cache`:
+        A result store holding the findings of the content tests for single
+        files, keyed by their content. The store can be shared
+        between packages.
+    `workers`:
+        The number of worker processes to run the content tests of files in.
+        The results are the same as when the files are tested serially, which
+        is what happens when this is `None`.
+    `css_tokenize`:
+        Run CSS through the full cssutils tokenizer as well as the scanner
+        that tests it. This is much slower, and only reports characters
+        which the tokenizer can't decode.
     """
-    bundle = ErrorBundle(listed=listed, spidermonkey=spidermonkey)
+    key = None
+    if (cache is not None and artifact is None and format == "json" and
+            os.path.isfile(path)):
+        key = resultcache.cache_key(
+            resultcache.hash_file(path), type="packaged_app", listed=listed,
+            market_urls=market_urls, spidermonkey=spidermonkey, acorn=acorn,
+            fail_fast=fail_fast, prescreen_only=prescreen_only,
+            css_tokenize=css_tokenize)
+        output = cache.get(key)
+        if output is not None:
+            return output
+
+    bundle = ErrorBundle(listed=listed, spidermonkey=spidermonkey,
+                         fail_fast=fail_fast,
+                         max_tier=(constants.PRESCREEN_TIER if
+                                   prescreen_only else None))
     bundle.save_resource("packaged", True)
     bundle.save_resource("acorn", acorn)
+    bundle.save_resource("css_tokenize", css_tokenize)
+    if artifact is not None:
+        bundle.save_resource("artifact", artifact)
+    if findings_cache is not None:
+        bundle.save_resource("findings_cache",
+                             resultcache.FindingsCache(findings_cache))
+    bundle.save_resource("workers", workers)
 
     # Set the market URLs.
     bundle.save_resource("market_urls", market_urls)
 
     submain.prepare_package(bundle, path, timeout)
-    return format_result(bundle, format)
+
+    output = format_result(bundle, format)
+    # Validations which were cut short by a timeout or by the decompression
+    # limit aren't cached, since the timeout isn't part of the key.
+    if key is not None and not bundle.get_resource("interrupted"):
+        cache.set(key, output)
+    return output
 
 
 def format_result(bundle, format):
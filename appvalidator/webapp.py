@@ -33,6 +33,8 @@ def detect_webapp_string(err, data):
     else:
         ws = WebappSpec(webapp, err)
         ws.validate()
+        if err.should_halt():
+            return webapp
 
         def long_name_warning(appendix=None):
             if appendix:
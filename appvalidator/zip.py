@@ -1,6 +1,24 @@
-from zipfile import ZipFile
+from array import array
+from collections import OrderedDict
+import mmap
+import struct
+import sys
+from zipfile import (BadZipfile, ZipFile, ZIP_STORED, sizeFileHeader,
+                     stringFileHeader, structFileHeader,
+                     _FH_EXTRA_FIELD_LENGTH, _FH_FILENAME_LENGTH,
+                     _FH_GENERAL_PURPOSE_FLAG_BITS, _FH_SIGNATURE)
 import zlib
 
+from constants import (MAX_COMPRESSION_RATIO, MAX_FILE_CACHE_SIZE,
+                       MAX_MEMBER_SIZE, MAX_UNCOMPRESSED_SIZE,
+                       RATIO_CHECK_MIN_SIZE)
+from sweep import CHUNK_SIZE, sweep_package
+import unicodehelper
+
+
+# The number of bytes used for each character of a unicode string.
+UNICODE_SIZE = 4 if sys.maxunicode > 0xFFFF else 2
+
 
 def to_utf8(s):
     if isinstance(s, unicode):
@@ -8,6 +26,242 @@ def to_utf8(s):
     return s
 
 
+class DecompressionLimitExceeded(Exception):
+    """Raised when a package would decompress to more data than the
+    validator is willing to handle."""
+
+    def __init__(self, message, filename=None):
+        super(DecompressionLimitExceeded, self).__init__(message)
+        self.filename = filename
+
+
+class LimitedStream(object):
+    """Wraps the stream of a member and checks the decompression limits of
+    the package as data is read from it."""
+
+    def __init__(self, package, name, stream):
+        self.package = package
+        self.name = name
+        self.stream = stream
+        self.size = 0
+
+    def read(self, size=-1):
+        # The member is inflated a chunk at a time, so that it can't grow
+        # past the limits in memory before they are checked.
+        chunks = []
+        remaining = size if size >= 0 else None
+        while remaining != 0:
+            chunk = self.stream.read(CHUNK_SIZE if remaining is None else
+                                     min(remaining, CHUNK_SIZE))
+            if not chunk:
+                break
+            self.size += len(chunk)
+            self.package._count_inflated(self.name, self.size)
+            chunks.append(chunk)
+            if remaining is not None:
+                remaining -= len(chunk)
+        return "".join(chunks)
+
+    def close(self):
+        self.stream.close()
+
+
+class ViewStream(object):
+    """A file-like object over a buffer view of a stored member. Reads only
+    copy the bytes that are asked for. The CRC of the member is checked once
+    the end of the view is reached, as `ZipFile` would."""
+
+    def __init__(self, view, name=None, crc=None):
+        self.view = view
+        self.name = name
+        self.crc = crc
+        self.position = 0
+
+    def read(self, size=-1):
+        end = len(self.view)
+        if size >= 0:
+            end = min(end, self.position + size)
+        data = self.view[self.position:end]
+        self.position = end
+
+        if self.crc is not None and end == len(self.view):
+            crc, self.crc = self.crc, None
+            if zlib.crc32(self.view) & 0xffffffff != crc:
+                raise BadZipfile("Bad CRC-32 for file %r" % self.name)
+        return data
+
+    def seek(self, offset, whence=0):
+        if whence == 1:
+            offset += self.position
+        elif whence == 2:
+            offset += len(self.view)
+        self.position = max(0, min(offset, len(self.view)))
+
+    def tell(self):
+        return self.position
+
+    def close(self):
+        pass
+
+
+class MemberIndex(object):
+    """
+    A columnar index of the members of a ZIP file, built once from the
+    central directory. Each attribute is a column with one row per entry;
+    `positions` maps a member name to its row so that lookups are O(1).
+    """
+
+    def __init__(self, infolist):
+        self.names = []
+        self.names_lower = []
+        self.extensions = []
+        self.sizes = array("L")
+        self.compressed_sizes = array("L")
+        self.crcs = array("L")
+        self.offsets = array("L")
+        self.compress_types = array("H")
+
+        # When a name appears more than once, the last entry wins. This
+        # matches the behavior of `ZipFile.getinfo`.
+        self.positions = {}
+
+        for info in infolist:
+            self.positions[info.filename] = len(self.names)
+            self.names.append(info.filename)
+            name_lower = info.filename.lower()
+            self.names_lower.append(name_lower)
+            self.extensions.append(name_lower.split(".")[-1])
+            self.sizes.append(info.file_size)
+            self.compressed_sizes.append(info.compress_size)
+            self.crcs.append(info.CRC)
+            self.offsets.append(info.header_offset)
+            self.compress_types.append(info.compress_type)
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, name):
+        return name in self.positions
+
+    def info(self, name):
+        """Return a dict describing a member."""
+        row = self.positions[name]
+        return {"name": self.names[row],
+                "size": self.sizes[row],
+                "compressed_size": self.compressed_sizes[row],
+                "crc": self.crcs[row],
+                "name_lower": self.names_lower[row],
+                "extension": self.extensions[row]}
+
+
+class FileCache(object):
+    """
+    A cache of decompressed members which is bounded by the number of bytes
+    it holds. The least recently used members are evicted first. Pinned
+    members are kept apart from the others and are never evicted. The
+    decoded text of a member is cached alongside its data, within the same
+    budget.
+    """
+
+    def __init__(self, max_size=MAX_FILE_CACHE_SIZE):
+        self.max_size = max_size
+        self.size = 0
+
+        self.entries = OrderedDict()
+        self.pinned = set()
+        self.pinned_entries = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.decodes = 0
+
+    def __contains__(self, name):
+        return ((name, False) in self.entries or
+                (name, False) in self.pinned_entries)
+
+    def get(self, name, text=False, count=True):
+        """Return the cached data for a member, or None if it isn't
+        cached. With `text`, the decoded text of the member is returned.
+        When `count` is False, a miss isn't counted, since the lookup is
+        followed by another for the same read."""
+        key = name, text
+        if key in self.pinned_entries:
+            self.hits += 1
+            return self.pinned_entries[key]
+
+        data = self.entries.pop(key, None)
+        if data is None:
+            if count:
+                self.misses += 1
+            return None
+
+        # Move the member to the most recently used end.
+        self.entries[key] = data
+        self.hits += 1
+        return data
+
+    def put(self, name, data, text=False):
+        """Store the data for a member, evicting other members if the cache
+        grows beyond its budget. With `text`, `data` is the decoded text of
+        the member."""
+        key = name, text
+        if text:
+            self.decodes += 1
+        self._discard(key)
+
+        size = _cache_size(data)
+        if name in self.pinned:
+            self.pinned_entries[key] = data
+        elif size > self.max_size:
+            # There's no sense in flushing the cache for something that
+            # won't fit in it.
+            return
+        else:
+            self.entries[key] = data
+        self.size += size
+
+        while self.size > self.max_size and self.entries:
+            evicted_key, evicted = self.entries.popitem(last=False)
+            self.size -= _cache_size(evicted)
+            self.evictions += 1
+
+    def _discard(self, key):
+        data = self.entries.pop(key, None)
+        if data is None:
+            data = self.pinned_entries.pop(key, None)
+        if data is not None:
+            self.size -= _cache_size(data)
+
+    def discard(self, name):
+        """Remove a member from the cache, if it is present."""
+        self._discard((name, False))
+        self._discard((name, True))
+
+    def pin(self, name):
+        """Keep a member in the cache once it has been read."""
+        self.pinned.add(name)
+        for key in ((name, False), (name, True)):
+            if key in self.entries:
+                self.pinned_entries[key] = self.entries.pop(key)
+
+    def stats(self):
+        """Return a dict of cache statistics."""
+        return {"hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "decodes": self.decodes,
+                "size": self.size,
+                "max_size": self.max_size}
+
+
+def _cache_size(data):
+    """Return the number of bytes that cached data takes up."""
+    if isinstance(data, unicode):
+        return len(data) * UNICODE_SIZE
+    return len(data)
+
+
 class ZipPackage(object):
     """
     A ZIP reader and management class. Allows fun things like reading, listing,
@@ -15,7 +269,14 @@ class ZipPackage(object):
     things like zip files or IO.
     """
 
-    def __init__(self, package, mode="r", name=None):
+    # Members that are read by several tests and should stay in the cache.
+    PINNED_FILES = ("manifest.webapp", )
+
+    def __init__(self, package, mode="r", name=None,
+                 cache_size=MAX_FILE_CACHE_SIZE,
+                 max_size=MAX_UNCOMPRESSED_SIZE,
+                 max_member_size=MAX_MEMBER_SIZE,
+                 max_ratio=MAX_COMPRESSION_RATIO):
         self.zf = ZipFile(package, mode=mode)
 
         # Store away the filename for future use.
@@ -24,66 +285,258 @@ class ZipPackage(object):
 
         self.contents_cache = None
         self.broken_files = set()
+        self._broken_contents = None
+        self._members = None
+        self._sweep = None
+        self._mmap = None
+
+        # Members whose findings are replayed from a previous validation.
+        # The sweep doesn't need to decompress them.
+        self.unchanged_files = set()
+
+        self.file_cache = FileCache(cache_size)
+        # The encoding of each member that has been decoded, and the
+        # confidence of its detection.
+        self.encodings = {}
+        for pinned in self.PINNED_FILES:
+            self.file_cache.pin(pinned)
 
-        self.file_cache = {}
+        # Decompression limits. `inflated_size` counts the bytes that have
+        # been decompressed from the package. Members are often read more
+        # than once, so only the furthest that each member has been read,
+        # which is kept in `_inflated`, is counted.
+        self.max_size = max_size
+        self.max_member_size = max_member_size
+        self.max_ratio = max_ratio
+        self.inflated_size = 0
+        self._inflated = {}
+
+    @property
+    def members(self):
+        """The index of the members of the package."""
+        if self._members is None:
+            self._members = MemberIndex(self.zf.infolist())
+        return self._members
 
     def __iter__(self):
-        return (name for name in self.zf.namelist() if
+        return (name for name in self.members.names if
                 name not in self.broken_files)
 
     def __contains__(self, item):
         if item in self.broken_files:
             return False
-        return item in self.zf.namelist()
+        return item in self.members
 
     def info(self, name):
         """Get info on a single file."""
-        return self.package_contents()[name]
+        if name in self.broken_files:
+            raise KeyError(name)
+        return self.members.info(name)
 
     def package_contents(self):
         """Return a dictionary of file information."""
 
-        if self.contents_cache and not self.broken_files:
+        if not self.broken_files:
+            if not self.contents_cache:
+                self.contents_cache = dict(
+                    (name, self.members.info(name)) for
+                    name in self.members.positions)
             return self.contents_cache
 
-        # Get a list of ZipInfo objects.
-        files = self.zf.infolist()
-        out_files = {}
+        # Broken files are left out of the listing. The filtered listing is
+        # kept until more broken files are found.
+        broken = frozenset(self.broken_files)
+        if self._broken_contents and self._broken_contents[0] == broken:
+            return self._broken_contents[1]
+
+        out_files = dict((name, self.members.info(name)) for
+                         name in self.members.positions if
+                         name not in broken)
+        self._broken_contents = broken, out_files
+        return out_files
 
-        # Iterate through each file in the ZIP.
-        for file_ in files:
-            if file_.filename in self.broken_files:
-                continue
+    def check_limits(self):
+        """Check the sizes declared in the central directory against the
+        decompression limits, raising DecompressionLimitExceeded if any of
+        them is exceeded."""
 
-            file_doc = {"name": file_.filename,
-                        "size": file_.file_size,
-                        "name_lower": file_.filename.lower()}
+        members = self.members
+        if sum(members.sizes) > self.max_size:
+            raise DecompressionLimitExceeded(
+                "The package decompresses to more than %d bytes." %
+                    self.max_size)
 
-            file_doc["extension"] = file_doc["name_lower"].split(".")[-1]
+        for row, size in enumerate(members.sizes):
+            self._check_member(members.names[row], size,
+                               members.compressed_sizes[row])
 
-            out_files[file_.filename] = file_doc
+    def _check_member(self, name, size, compressed_size):
+        if size > self.max_member_size:
+            raise DecompressionLimitExceeded(
+                "The file decompresses to more than %d bytes." %
+                    self.max_member_size, name)
+        if (size > RATIO_CHECK_MIN_SIZE and
+                size > compressed_size * self.max_ratio):
+            raise DecompressionLimitExceeded(
+                "The file has a compression ratio above %d:1." %
+                    self.max_ratio, name)
 
-        self.contents_cache = out_files
-        return out_files
+    def _count_inflated(self, name, member_size):
+        """Account for data that has been decompressed from a member, which
+        has been read up to `member_size` bytes. The limits are enforced as
+        the data streams out, since the sizes in the central directory can't
+        be trusted."""
+
+        inflated = self._inflated.get(name, 0)
+        if member_size <= inflated:
+            # This part of the member has been counted already.
+            return
+        self._inflated[name] = member_size
+        self.inflated_size += member_size - inflated
+        if self.inflated_size > self.max_size:
+            raise DecompressionLimitExceeded(
+                "The package decompresses to more than %d bytes." %
+                    self.max_size, name)
+        if name in self.members:
+            self._check_member(
+                name, member_size,
+                self.members.compressed_sizes[self.members.positions[name]])
+
+    def _map(self):
+        """Memory-map the package, if it lives on disk. Returns None when
+        the package can't be mapped."""
+        if self._mmap is None:
+            self._mmap = False
+            if self.zf.mode == "r":
+                try:
+                    self._mmap = mmap.mmap(self.zf.fp.fileno(), 0,
+                                           access=mmap.ACCESS_READ)
+                except (AttributeError, EnvironmentError, ValueError):
+                    pass
+        return self._mmap or None
+
+    def view(self, filename):
+        """Return a zero-copy buffer over the data of a stored member, or
+        None if the member is compressed or the package isn't on disk. As
+        with `read`, the CRC of the data is checked and the data counts
+        against the decompression limits. The buffer is only valid until the
+        package is closed."""
+
+        if filename in self.broken_files:
+            raise KeyError(filename)
+        row = self.members.positions[filename]
+        view = self._view(row)
+        if view is not None:
+            self._count_inflated(filename, len(view))
+            if zlib.crc32(view) & 0xffffffff != self.members.crcs[row]:
+                raise BadZipfile("Bad CRC-32 for file %r" % filename)
+        return view
+
+    def _view(self, row):
+        members = self.members
+        if members.compress_types[row] != ZIP_STORED:
+            return None
+
+        mapped = self._map()
+        if mapped is None:
+            return None
+
+        # The data follows the local file header, whose name and extra
+        # fields may differ in length from those in the central directory.
+        offset = members.offsets[row]
+        header = mapped[offset:offset + sizeFileHeader]
+        if len(header) != sizeFileHeader:
+            return None
+        header = struct.unpack(structFileHeader, header)
+        if (header[_FH_SIGNATURE] != stringFileHeader or
+                header[_FH_GENERAL_PURPOSE_FLAG_BITS] & 0x1):
+            # Leave bad headers and encrypted members to `ZipFile`.
+            return None
+
+        start = (offset + sizeFileHeader + header[_FH_FILENAME_LENGTH] +
+                 header[_FH_EXTRA_FIELD_LENGTH])
+        size = members.sizes[row]
+        if start + size > len(mapped):
+            return None
+        return buffer(mapped, start, size)
+
+    def open(self, filename):
+        """Return a file-like object which streams a member of the
+        archive. Stored members are read straight from the mapped package."""
+        row = self.members.positions.get(filename)
+        view = self._view(row) if row is not None else None
+        if view is not None:
+            stream = ViewStream(view, filename, self.members.crcs[row])
+        else:
+            stream = self.zf.open(filename)
+        return LimitedStream(self, filename, stream)
+
+    def close(self):
+        """Release the memory map of the package and close the archive."""
+        if self._mmap:
+            self._mmap.close()
+        # The package is never mapped again.
+        self._mmap = False
+        self.zf.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+    def sweep(self):
+        """Return the results of the archive sweep, running it the first
+        time it is needed."""
+        if self._sweep is None:
+            self._sweep = sweep_package(self)
+        return self._sweep
 
     def read(self, filename):
         "Reads a file from the archive and returns a string."
 
-        if filename in self.file_cache:
-            return self.file_cache[filename]
+        output = self.file_cache.get(filename)
+        if output is not None:
+            return output
 
         try:
-            output = self.zf.read(filename)
+            stream = self.open(filename)
+            try:
+                chunks = []
+                while True:
+                    chunk = stream.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    chunks.append(chunk)
+                output = "".join(chunks)
+            finally:
+                stream.close()
         except zlib.error:
             self.broken_files.add(filename)
             raise
         else:
-            self.file_cache[filename] = output
+            self.file_cache.put(filename, output)
             return output
 
+    def read_text(self, filename):
+        """Reads a file from the archive and returns it as unicode. The
+        text is cached, so that each member is only decoded once."""
+
+        # A miss is counted by `read`, so that each read counts once.
+        text = self.file_cache.get(filename, text=True, count=False)
+        if text is not None:
+            return text
+
+        text, encoding, confidence = unicodehelper.detect_and_decode(
+            self.read(filename))
+        self.encodings[filename] = encoding, confidence
+        self.file_cache.put(filename, text, text=True)
+        return text
+
     def write(self, name, data):
         """Write a blob of data to the ZIP manager."""
         self.zf.writestr(name, to_utf8(data))
+        self._invalidate(name)
 
     def write_file(self, name, path=None):
         """Write the contents of a file from the disk to the ZIP."""
@@ -92,3 +545,11 @@ class ZipPackage(object):
             path = name
 
         self.zf.write(path, name)
+        self._invalidate(name)
+
+    def _invalidate(self, name):
+        """Forget what is known about the members of the package once the
+        member `name` has been written."""
+        self._members = self.contents_cache = self._broken_contents = None
+        self.broken_files.discard(name)
+        self.file_cache.discard(name)
@@ -0,0 +1,103 @@
+"""Time the validation of a corpus of packaged apps.
+
+Usage: python extras/benchmark.py [--repeat N] [--fail-fast] [--workers N]
+                                  [--filter-ascii MB] package.zip ...
+
+Each package is validated `repeat` times and the best wall time is reported,
+along with the number of errors and whether the result was partial. With
+`--workers`, each package is also validated with its files tested by that many
+worker processes. With `--filter-ascii`, textfilter.filter_ascii is timed on
+`str` and `unicode` text of that many megabytes.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from appvalidator import validate_packaged_app
+from appvalidator.textfilter import filter_ascii
+
+# The text that filter_ascii is timed on is made of these samples, which mix
+# plain ASCII with control and non-ASCII characters.
+FILTER_SAMPLES = {
+    "str": "".join(chr(i) for i in range(256)) + "plain ASCII text\n" * 16,
+    "unicode": u"caf\xe9 \u2603 \x07 plain ASCII text\n" * 16,
+}
+
+
+def time_package(path, repeat, **kwargs):
+    best = None
+    for i in range(repeat):
+        start = time.time()
+        result = json.loads(validate_packaged_app(path, listed=False,
+                                                  **kwargs))
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best, result
+
+
+def time_filter_ascii(size, repeat):
+    """Time filter_ascii on `size` bytes of `str` and `unicode` text."""
+    for name, sample in sorted(FILTER_SAMPLES.items()):
+        text = sample * (size // len(sample) + 1)
+        best = None
+        for i in range(repeat):
+            start = time.time()
+            filter_ascii(text)
+            elapsed = time.time() - start
+            if best is None or elapsed < best:
+                best = elapsed
+        print "%-10s %8.1fms  filter_ascii on %d characters" % (
+            name, best * 1000, len(text))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Time the validation of packaged apps.")
+    parser.add_argument("packages", nargs="*",
+                        help="The packages to validate")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="The number of times to validate each package")
+    parser.add_argument("--fail-fast", action="store_true",
+                        help="Also time each package in fail-fast mode")
+    parser.add_argument("--workers", type=int,
+                        help="Also time each package with its files tested "
+                             "by this many processes")
+    parser.add_argument("--filter-ascii", type=int, metavar="MB",
+                        help="Time filter_ascii on this many megabytes of "
+                             "text")
+    args = parser.parse_args()
+
+    if args.filter_ascii:
+        time_filter_ascii(args.filter_ascii * 1024 * 1024, args.repeat)
+        if not args.packages:
+            return
+
+    modes = [("full", {})]
+    if args.fail_fast:
+        modes.append(("fail-fast", {"fail_fast": True}))
+    if args.workers:
+        modes.append(("workers=%d" % args.workers,
+                      {"workers": args.workers}))
+
+    totals = dict((name, 0.0) for name, kwargs in modes)
+    for path in args.packages:
+        for name, kwargs in modes:
+            elapsed, result = time_package(path, args.repeat, **kwargs)
+            totals[name] += elapsed
+            print "%-10s %8.1fms  %3d errors%s  %s" % (
+                name, elapsed * 1000, result["errors"],
+                " (partial)" if result["partial"] else "", path)
+
+    print
+    for name, kwargs in modes:
+        print "%-10s %8.1fms total" % (name, totals[name] * 1000)
+
+
+if __name__ == "__main__":
+    main()
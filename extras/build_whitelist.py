@@ -1,14 +1,110 @@
-import sys
+"""Build the library hash whitelist.
+
+Usage: python build_whitelist.py [--existing hashes.txt] [--output NAME]
+                                 [directory ...]
+
+Every file within the directories is hashed the same way the validator
+hashes the files of a package. The hashes are written, with the file names,
+to NAME.txt, and as binary indexes to NAME.idx for scripts, NAME-css.idx for
+stylesheets and NAME-markup.idx for markup. The scripts are also
+fingerprinted, so that modified or bundled copies of them can be recognized,
+and their fingerprints are written to NAME.json. The name and version of
+each library are taken from its file name, as it is saved by
+jslibfetcher.py.
+
+The hashes and fingerprints of an existing whitelist are kept, so a
+whitelist can be extended with the libraries in a new directory, or the
+index can be rebuilt from the listing alone.
+"""
+
+import argparse
 import os
 import os.path as pth
-import hashlib
+import re
+import sys
+
+sys.path.insert(0, pth.join(pth.dirname(pth.abspath(__file__)), ".."))
+
+from appvalidator import unicodehelper
+from appvalidator.fingerprint import (fingerprint, read_fingerprints,
+                                      write_fingerprints)
+from appvalidator.hashindex import (index_path, INDEX_NAMES, whitelist_type,
+                                    write_index)
+from appvalidator.sweep import CHUNK_SIZE, NormalizedHasher
+
+# Libraries are saved as <name>.<version>.<file name>.
+LIBRARY_NAME = re.compile(r"^(?P<name>[^.]+)\."
+                          r"(?:(?P<version>\d+(?:\.\d+)*[a-z]*\d*|master)\.)?")
+
+
+def hash_file(path):
+    hasher = NormalizedHasher()
+    with open(path, "rb") as file_:
+        for chunk in iter(lambda: file_.read(CHUNK_SIZE), ""):
+            hasher.feed(chunk)
+    hasher.feed("")
+    return hasher.finish()
+
+
+def fingerprint_file(path, filename):
+    match = LIBRARY_NAME.match(filename)
+    if match:
+        name, version = match.group("name", "version")
+    else:
+        name, version = filename.rsplit(".", 1)[0], None
+    with open(path, "rb") as file_:
+        data = file_.read().replace("\r\n", "\n")
+    return fingerprint(name, version, unicodehelper.decode(data))
+
+
+def build_whitelist(directories, existing=None, output="whitelist_hashes"):
+    hashes = []
+    libraries = []
+    if existing:
+        with open(existing) as listing:
+            hashes.extend(tuple(line.strip().split(None, 1)) for
+                          line in listing if line.strip())
+        existing_fingerprints = "%s.json" % pth.splitext(existing)[0]
+        if pth.exists(existing_fingerprints):
+            libraries.extend(read_fingerprints(existing_fingerprints))
+
+    for directory in directories:
+        for root, dirs, files in os.walk(directory):
+            dirs.sort()
+            for filename in sorted(files):
+                path = pth.join(root, filename)
+                hash = hash_file(path)
+                print path, hash
+                hashes.append((hash, filename))
+                if filename.endswith(".js"):
+                    libraries.append(fingerprint_file(path, filename))
+
+    written = set()
+    with open("%s.txt" % output, mode="w") as listing:
+        for entry in hashes:
+            if entry not in written:
+                written.add(entry)
+                listing.write('%s %s\n' % entry)
+    for type_ in INDEX_NAMES:
+        write_index((hash for hash, filename in hashes if
+                     whitelist_type(filename) == type_),
+                    index_path(output, type_))
+    write_fingerprints(libraries, "%s.json" % output)
+    return hashes
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Build the library hash whitelist.")
+    parser.add_argument("directories", nargs="*",
+                        help="The directories holding the libraries")
+    parser.add_argument("--existing",
+                        help="A whitelist listing whose hashes are kept")
+    parser.add_argument("--output", default="whitelist_hashes",
+                        help="The name of the files to write")
+    args = parser.parse_args()
+    build_whitelist(args.directories, args.existing, args.output)
 
-with open("whitelist_hashes.txt", mode="w") as output:
-    for root, dirs, files in os.walk(sys.argv[1]):
-        for filename in sorted(files):
-            path = pth.join(pth.dirname(pth.abspath(sys.argv[0])),
-                            root, filename)
-            hash = hashlib.sha256(open(path).read()).hexdigest()
-            print path, hash
-            output.write('%s %s\n' % (hash, pth.split(path)[-1]))
 
+if __name__ == "__main__":
+    main()
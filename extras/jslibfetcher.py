@@ -1,18 +1,46 @@
+"""Download the libraries that are whitelisted by their hashes.
+
+Usage: python jslibfetcher.py [directory]
+
+The scripts, stylesheets and markup of the libraries are downloaded to
+`directory` (jslibs/ by default), and the whitelist is then built from them
+with build_whitelist.py, keeping the hashes of any other libraries that are
+already listed in hashes.txt.
+"""
+
 import urllib
 import os
+import sys
+
+from build_whitelist import build_whitelist
+
+LIBRARY_DIR = sys.argv[1] if len(sys.argv) > 1 else "jslibs"
+HASHES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..",
+                      "appvalidator", "testcases", "hashes.txt")
+
+if not os.path.isdir(LIBRARY_DIR):
+    os.makedirs(LIBRARY_DIR)
 
 
 def process(url, destination):
-    destination = "jslibs/%s" % destination
+    destination = os.path.join(LIBRARY_DIR, destination)
 
     if os.path.exists(destination):
         return
 
     try:
         print url
-        urllib.urlretrieve(url, destination)
+        response = urllib.urlopen(url)
+        # Error pages must not end up in the whitelist.
+        if response.getcode() not in (None, 200):
+            print "Failed", response.getcode()
+            return
+        data = response.read()
     except Exception as e:
         print "Failed", e
+        return
+    with open(destination, "wb") as file_:
+        file_.write(data)
 
 
 def get_pattern(prefix, url_pattern, versions):
@@ -27,6 +55,22 @@ BACKBONE_VERSIONS = [
     "1.1.1",
     "1.1.2",
 ]
+BOOTSTRAP_VERSIONS = [
+    "3.0.0",
+    "3.0.1",
+    "3.0.2",
+    "3.0.3",
+    "3.1.0",
+    "3.1.1",
+    "3.2.0",
+    "3.3.0",
+    "3.3.1",
+    "3.3.2",
+    "3.3.4",
+    "3.3.5",
+    "3.3.6",
+    "3.3.7",
+]
 DOJO_VERSIONS = [
     "1.4.0",
     "1.4.1",
@@ -56,6 +100,84 @@ EXT_VERSIONS = [
     "3.0.0",
     "3.1.0",
 ]
+FONTAWESOME_VERSIONS = [
+    "4.0.0",
+    "4.0.1",
+    "4.0.2",
+    "4.0.3",
+    "4.1.0",
+    "4.2.0",
+    "4.3.0",
+    "4.4.0",
+    "4.5.0",
+    "4.6.0",
+    "4.6.1",
+    "4.6.2",
+    "4.6.3",
+    "4.7.0",
+]
+FOUNDATION_VERSIONS = [
+    "5.0.2",
+    "5.0.3",
+    "5.1.0",
+    "5.1.1",
+    "5.2.0",
+    "5.2.1",
+    "5.2.2",
+    "5.2.3",
+    "5.3.0",
+    "5.3.1",
+    "5.3.3",
+    "5.4.0",
+    "5.4.3",
+    "5.4.5",
+    "5.4.6",
+    "5.4.7",
+    "5.5.0",
+    "5.5.1",
+    "5.5.2",
+    "5.5.3",
+]
+# The stylesheets of the Gaia building blocks, which are copied into Firefox
+# OS apps as they are.
+GAIA_STYLES = [
+    "action_menu",
+    "buttons",
+    "confirm",
+    "edit_mode",
+    "headers",
+    "input_areas",
+    "lists",
+    "progress_activity",
+    "scrolling",
+    "seekbars",
+    "status",
+    "switches",
+    "tabs",
+    "toolbars",
+    "value_selector",
+]
+GAIA_UNSTABLE_STYLES = [
+    "drawer",
+    "lists",
+    "progress_activity",
+    "range",
+    "scrolling",
+    "seekbars",
+    "tabs",
+]
+GAIA_FILES = [
+    "cross_browser.css",
+    "transitions.css",
+    "util.css",
+    "index.html",
+]
+H5BP_VERSIONS = [
+    "4.0.0",
+    "4.1.0",
+    "4.2.0",
+    "4.3.0",
+]
 JQUERY_VERSIONS = [
     "1.0.1",
     "1.0.2",
@@ -429,3 +551,80 @@ get_pattern(
     "webl10n",
     "https://raw.githubusercontent.com/fabi1cazenave/webL10n/%s/l10n.js",
     ['master'])
+
+
+# Bootstrap
+get_pattern(
+    "bootstrap",
+    "https://maxcdn.bootstrapcdn.com/bootstrap/%s/css/bootstrap.css",
+    BOOTSTRAP_VERSIONS)
+get_pattern(
+    "bootstrap",
+    "https://maxcdn.bootstrapcdn.com/bootstrap/%s/css/bootstrap.min.css",
+    BOOTSTRAP_VERSIONS)
+get_pattern(
+    "bootstrap",
+    "https://maxcdn.bootstrapcdn.com/bootstrap/%s/css/bootstrap-theme.css",
+    BOOTSTRAP_VERSIONS)
+get_pattern(
+    "bootstrap",
+    "https://maxcdn.bootstrapcdn.com/bootstrap/%s/css/bootstrap-theme.min.css",
+    BOOTSTRAP_VERSIONS)
+
+# Font Awesome
+get_pattern(
+    "font-awesome",
+    "https://maxcdn.bootstrapcdn.com/font-awesome/%s/css/font-awesome.css",
+    FONTAWESOME_VERSIONS)
+get_pattern(
+    "font-awesome",
+    "https://maxcdn.bootstrapcdn.com/font-awesome/%s/css/font-awesome.min.css",
+    FONTAWESOME_VERSIONS)
+
+# Foundation
+get_pattern(
+    "foundation",
+    "https://cdnjs.cloudflare.com/ajax/libs/foundation/%s/css/foundation.css",
+    FOUNDATION_VERSIONS)
+get_pattern(
+    "foundation",
+    "https://cdnjs.cloudflare.com/ajax/libs/foundation/%s/css/foundation.min.css",
+    FOUNDATION_VERSIONS)
+get_pattern(
+    "foundation",
+    "https://cdnjs.cloudflare.com/ajax/libs/foundation/%s/css/normalize.css",
+    FOUNDATION_VERSIONS)
+
+# Gaia building blocks
+get_pattern(
+    "gaia-bb",
+    "https://raw.githubusercontent.com/buildingfirefoxos/Building-Blocks/"
+    "master/style/%s.css",
+    GAIA_STYLES)
+get_pattern(
+    "gaia-bb-unstable",
+    "https://raw.githubusercontent.com/buildingfirefoxos/Building-Blocks/"
+    "master/style_unstable/%s.css",
+    GAIA_UNSTABLE_STYLES)
+get_pattern(
+    "gaia-bb",
+    "https://raw.githubusercontent.com/buildingfirefoxos/Building-Blocks/"
+    "master/%s",
+    GAIA_FILES)
+
+# HTML5 Boilerplate
+get_pattern(
+    "h5bp",
+    "https://raw.githubusercontent.com/h5bp/html5-boilerplate/v%s/index.html",
+    H5BP_VERSIONS)
+get_pattern(
+    "h5bp",
+    "https://raw.githubusercontent.com/h5bp/html5-boilerplate/v%s/404.html",
+    H5BP_VERSIONS)
+get_pattern(
+    "h5bp",
+    "https://raw.githubusercontent.com/h5bp/html5-boilerplate/v%s/css/main.css",
+    H5BP_VERSIONS)
+
+
+build_whitelist([LIBRARY_DIR], existing=HASHES)
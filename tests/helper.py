@@ -1,14 +1,43 @@
 from functools import wraps
+import json
 import sys
+import zipfile
 
 import requests
 from mock import MagicMock, Mock, patch
 
-from appvalidator.zip import ZipPackage
+from appvalidator import unicodehelper
+from appvalidator.sweep import sweep_package
+from appvalidator.zip import FileCache, ZipPackage
 from appvalidator.errorbundle import ErrorBundle
 from appvalidator.errorbundle.outputhandlers.shellcolors import OutputHandler
 
 
+# Markup which violates the CSP, with an inline event handler and a remote
+# script.
+CSP_MARKUP = """<html><body>
+<script src="http://foo.bar/baz.js"></script>
+<a onclick="foo()">Foo</a>
+</body></html>
+"""
+
+
+def make_webapp(path, app_type="web", files=None):
+    """Write a packaged app of the given type to `path`. Its index.html
+    violates the CSP. `files` maps the names of any other members to their
+    data."""
+
+    manifest = {"name": "Test App", "description": "A test app.",
+                "developer": {"name": "Mozilla"}, "type": app_type,
+                "launch_path": "/index.html"}
+    with zipfile.ZipFile(path, "w") as zf:
+        zf.writestr("manifest.webapp", json.dumps(manifest))
+        zf.writestr("index.html", CSP_MARKUP)
+        for name, data in (files or {}).items():
+            zf.writestr(name, data)
+    return path
+
+
 def _do_test(path, test, failure=True, set_type=0,
              listed=False, xpi_mode="r"):
 
@@ -177,13 +206,17 @@ class MockXPI:
         self.data = data
         self.filename = "mock_xpi.xpi"
         self.default_size = default_size
+        self.file_cache = FileCache()
+        self.encodings = {}
+        self.unchanged_files = set()
 
     def test(self):
         return True
 
     def info(self, name):
-        name = name.split('/')[-1]
-        return {"name_lower": name.lower(),
+        full_name, name = name, name.split('/')[-1]
+        return {"name": full_name,
+                "name_lower": name.lower(),
                 "size": self.default_size,
                 "extension": name.lower().split(".")[-1]}
 
@@ -196,3 +229,18 @@ class MockXPI:
 
     def read(self, name):
         return open(self.data[name]).read()
+
+    def read_text(self, name):
+        text, encoding, confidence = unicodehelper.detect_and_decode(
+            self.read(name))
+        self.encodings[name] = encoding, confidence
+        return text
+
+    def open(self, name):
+        return open(self.data[name], "rb")
+
+    def view(self, name):
+        return None
+
+    def sweep(self):
+        return sweep_package(self)
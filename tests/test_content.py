@@ -1,9 +1,20 @@
 import hashlib
-from mock import patch
+import json
+import os
+import shutil
+from StringIO import StringIO
+import tempfile
+from zipfile import ZipFile
+
+from mock import Mock, patch
 from nose.tools import eq_, ok_
 
-from helper import MockXPI, TestCase
+from helper import CSP_MARKUP, make_webapp, MockXPI, TestCase
 
+from appvalidator import validate_packaged_app
+from appvalidator.fingerprint import (fingerprint, FingerprintIndex,
+                                      write_fingerprints)
+from appvalidator.incremental import comparable_findings
 from appvalidator.zip import ZipPackage
 import appvalidator.testcases.content as content
 from appvalidator.constants import *
@@ -180,15 +191,365 @@ class TestContent(TestCase):
         foo_js = mock_package.read('foo.js').replace('\r\n', '\n')
         hashes_whitelist = [hashlib.sha256(foo_js).hexdigest()]
 
-        with patch("appvalidator.testcases.content.hashes_whitelist",
-                   hashes_whitelist):
+        with patch.dict("appvalidator.testcases.content.hashes_whitelist",
+                        {"js": hashes_whitelist}):
             eq_(self._run_test(mock_package), 0)
             self.assert_passes()
+        eq_(self.err.metadata["whitelisted_files"],
+            {"js": {"files": 1, "size": mock_package.info("foo.js")["size"]}})
 
         # Prove that it would fail otherwise.
         eq_(self._run_test(mock_package), 1)
         self.assert_failed()
 
+    def test_whitelist_types(self):
+        """Test that stylesheets and markup are whitelisted by the hashes of
+        their own type."""
+
+        with open("tests/resources/markup/markuptester/"
+                  "bad_nesting.xml") as xml:
+            data = xml.read()
+        zip_data = StringIO()
+        zf = ZipFile(zip_data, mode="w")
+        zf.writestr("known.xml", data)
+        zf.writestr("known.css", "a { color: red }")
+        zf.writestr("known.js", data)
+        zf.close()
+        package = ZipPackage(zip_data, name="test.zip")
+
+        self.setup_err()
+        whitelist = {"markup": [hashlib.sha256(data).hexdigest()],
+                     "css": [hashlib.sha256("a { color: red }").hexdigest()]}
+        with patch.dict("appvalidator.testcases.content.hashes_whitelist",
+                        whitelist), \
+             patch("appvalidator.testcases.content._process_file",
+                   wraps=content._process_file) as process_file:
+            eq_(self._run_test(package), 1)
+
+        # The markup is only whitelisted as markup.
+        eq_([call[0][2] for call in process_file.call_args_list],
+            ["known.js"])
+        eq_(self.err.metadata["whitelisted_files"],
+            {"markup": {"files": 1, "size": len(data)},
+             "css": {"files": 1, "size": len("a { color: red }")}})
+
+    def test_encodings(self):
+        """Test that files whose encoding is in doubt are listed in the
+        metadata."""
+
+        zip_data = StringIO()
+        zf = ZipFile(zip_data, mode="w")
+        zf.writestr("ascii.css", "a { color: red }")
+        zf.writestr("latin_1.css", "a { content: '\xe4' }")
+        zf.writestr("utf_8.css", "a { content: '\xc3\xa4' }\n" * 1000)
+        zf.close()
+        package = ZipPackage(zip_data, name="test.zip")
+
+        self.setup_err()
+        eq_(self._run_test(package), 3)
+        eq_(self.err.metadata["encodings"],
+            {"latin_1.css": {"encoding": "latin_1", "confidence": 0.5}})
+
+    def test_libraries(self):
+        """Test that modified and bundled copies of known libraries are
+        listed in the metadata and left out of the JS tests."""
+
+        library = ("(function (window) {\n"
+                   "    window.widget = function (selector) {\n"
+                   "        return document.querySelector(selector);\n"
+                   "    };\n"
+                   "})(window);\n")
+        zip_data = StringIO()
+        zf = ZipFile(zip_data, mode="w")
+        zf.writestr("lib.js", "/* Modified */\n" + library)
+        zf.writestr("bundle.js", "var app = {};\n" + library + "foo bar;\n")
+        zf.close()
+        package = ZipPackage(zip_data, name="test.zip")
+
+        path = tempfile.mkdtemp()
+        try:
+            write_fingerprints([fingerprint("widget", "1.0", library)],
+                               os.path.join(path, "hashes.json"))
+            index = FingerprintIndex(os.path.join(path, "hashes.json"))
+
+            self.setup_err()
+            with patch("appvalidator.testcases.content."
+                       "library_fingerprints", index), \
+                 patch("appvalidator.testcases.content.testendpoint_js."
+                       "test_js_file") as test_js_file:
+                eq_(self._run_test(package), 2)
+        finally:
+            shutil.rmtree(path)
+
+        eq_(self.err.metadata["libraries"],
+            {"lib.js": [{"name": "widget", "version": "1.0"}],
+             "bundle.js": [{"name": "widget", "version": "1.0"}]})
+        eq_(test_js_file.call_count, 1)
+        err, name, data = test_js_file.call_args[0]
+        eq_(name, "bundle.js")
+        eq_(data.splitlines(), ["var app = {};", "", "", "", "",
+                                " " * len("})(window);"), "foo bar;"])
+
+    def test_libraries_large(self):
+        """Test that scripts which are too large for the JS tests are still
+        recognized as libraries, but aren't scanned for bundled ones."""
+
+        library = ("(function (window) {\n"
+                   "    window.widget = function (selector) {\n"
+                   "        return document.querySelector(selector);\n"
+                   "    };\n"
+                   "})(window);\n")
+        bundle = "var app = {};\n" + library
+
+        path = tempfile.mkdtemp()
+        try:
+            write_fingerprints([fingerprint("widget", "1.0", library)],
+                               os.path.join(path, "hashes.json"))
+            index = FingerprintIndex(os.path.join(path, "hashes.json"))
+
+            self.setup_err()
+            with patch("appvalidator.testcases.content."
+                       "library_fingerprints", index), \
+                 patch.object(content.testendpoint_js, "MAX_JS_SIZE", 64):
+                eq_(content._exclude_libraries(
+                        self.err, "lib.js", "/* Modified */\n" + library),
+                    None)
+                eq_(content._exclude_libraries(self.err, "bundle.js", bundle),
+                    bundle)
+        finally:
+            shutil.rmtree(path)
+
+        eq_(self.err.metadata["libraries"],
+            {"lib.js": [{"name": "widget", "version": "1.0"}]})
+
+    def test_fail_fast(self):
+        """Test that fail-fast mode stops processing files after the first
+        error."""
+
+        def process_file(err, package, name, file_data):
+            err.error(("foo", ), "Error in %s" % name, filename=name)
+            return True
+
+        mock_package = MockXPI(
+            {"foo.js": "tests/resources/content/junk.xpi",
+             "bar.js": "tests/resources/content/junk.xpi"})
+
+        with patch("appvalidator.testcases.content._process_file",
+                   process_file):
+            self.setup_err()
+            eq_(self._run_test(mock_package), 2)
+            assert not self.err.unfinished
+
+            self.setup_err()
+            self.err.fail_fast = True
+            eq_(self._run_test(mock_package), 1)
+            eq_(len(self.err.errors), 1)
+            assert self.err.unfinished
+
+    def test_duplicates(self):
+        """Test that copies of a file are analyzed once, and that its
+        messages are replicated for each copy."""
+
+        with open("tests/resources/markup/markuptester/"
+                  "bad_nesting.xml") as xml:
+            data = xml.read()
+
+        zip_data = StringIO()
+        zf = ZipFile(zip_data, mode="w")
+        zf.writestr("a/bad.xml", data)
+        zf.writestr("b/bad.xml", data)
+        zf.writestr("c/bad.xml", data + "\n")
+        zf.writestr("bad.html", data)
+        zf.close()
+        package = ZipPackage(zip_data, name="test.zip")
+
+        self.setup_err()
+        with patch("appvalidator.testcases.content._process_file",
+                   wraps=content._process_file) as process_file:
+            eq_(self._run_test(package), 4)
+        eq_(sorted(call[0][2] for call in process_file.call_args_list),
+            ["a/bad.xml", "bad.html", "c/bad.xml"])
+
+        eq_(sorted(message["file"] for message in self.err.warnings),
+            ["a/bad.xml", "b/bad.xml", "bad.html", "c/bad.xml"])
+        eq_(len(set(message["uid"] for message in self.err.warnings)), 4)
+
+    def test_parallel(self):
+        """Test that files tested by worker processes give the same results
+        as files tested serially."""
+
+        with open("tests/resources/markup/markuptester/"
+                  "bad_nesting.xml") as xml:
+            data = xml.read()
+
+        zip_data = StringIO()
+        zf = ZipFile(zip_data, mode="w")
+        zf.writestr("a/bad.xml", data)
+        zf.writestr("b/bad.xml", data)
+        zf.writestr(".hidden.xml", data)
+        zf.writestr("style.css", "#foo { color: red; }")
+        zf.writestr("extraclose.xml", open(
+            "tests/resources/markup/markuptester/extraclose.xml").read())
+        zf.writestr("empty.html", "")
+        zf.close()
+
+        def run(workers):
+            self.setup_err()
+            self.err.save_resource("workers", workers)
+            package = ZipPackage(StringIO(zip_data.getvalue()),
+                                 name="test.zip")
+            eq_(self._run_test(package), 4)
+            results = json.loads(self.err.render_json())
+            for message in results["messages"]:
+                del message["uid"]
+            return results
+
+        serial = run(None)
+        eq_(len(serial["messages"]), 4)
+        eq_(run(2), serial)
+
+    def test_parallel_schedule(self):
+        """Test that the most expensive files are handed to the workers
+        first."""
+
+        zip_data = StringIO()
+        zf = ZipFile(zip_data, mode="w")
+        zf.writestr("small.js", "x" * 5)
+        zf.writestr("medium.css", "x" * 30)
+        zf.writestr("large.html", "x" * 20)
+        zf.writestr("huge.css", "x" * 100)
+        zf.close()
+        package = ZipPackage(zip_data, name="test.zip")
+
+        names = []
+
+        class FakePool(object):
+            def __init__(self, workers):
+                pass
+
+            def imap_unordered(self, func, jobs):
+                names.extend(job[0] for job in jobs)
+                results = iter(map(func, jobs))
+                return Mock(next=lambda timeout: next(results))
+
+            def close(self):
+                pass
+
+            terminate = join = close
+
+        self.setup_err()
+        self.err.save_resource("workers", 2)
+        with patch("multiprocessing.Pool", FakePool):
+            eq_(self._run_test(package), 4)
+        eq_(names, ["huge.css", "large.html", "medium.css", "small.js"])
+
+    def test_parallel_lazy(self):
+        """Test that files are only read as the workers take them."""
+
+        zip_data = StringIO()
+        zf = ZipFile(zip_data, mode="w")
+        zf.writestr("small.css", "x" * 5)
+        zf.writestr("large.css", "x" * 20)
+        zf.writestr("medium.css", "x" * 10)
+        zf.close()
+        package = ZipPackage(zip_data, name="test.zip")
+
+        events = []
+
+        def read_file(package, name, file_info):
+            events.append(("read", name))
+            return read_file.original(package, name, file_info)
+        read_file.original = content._read_file
+
+        def analyze(job):
+            events.append(("analyze", job[0]))
+            return analyze.original(job)
+        analyze.original = content._analyze_in_worker
+
+        self.setup_err()
+        self.err.save_resource("workers", 2)
+        with patch("multiprocessing.Pool", LazyPool):
+            with patch("appvalidator.testcases.content._read_file",
+                       read_file):
+                with patch("appvalidator.testcases.content."
+                           "_analyze_in_worker", analyze):
+                    eq_(self._run_test(package), 3)
+        eq_(events[:6], [("read", "large.css"), ("analyze", "large.css"),
+                         ("read", "medium.css"), ("analyze", "medium.css"),
+                         ("read", "small.css"), ("analyze", "small.css")])
+
+    def test_parallel_fail_fast(self):
+        """Test that the workers stop once a file has an error in fail-fast
+        mode, with the same results as in serial mode."""
+
+        path = tempfile.mkdtemp()
+        try:
+            app = make_webapp(
+                os.path.join(path, "app.zip"), "privileged",
+                files={"a.html": CSP_MARKUP + " ", "b.html": CSP_MARKUP})
+            analyzed = []
+
+            def analyze(job):
+                analyzed.append(job[0])
+                return analyze.original(job)
+            analyze.original = content._analyze_in_worker
+
+            def run(workers):
+                return comparable_findings(json.loads(
+                    validate_packaged_app(app, listed=False, fail_fast=True,
+                                          workers=workers)))
+
+            serial = run(None)
+            eq_(len(set(message["file"] for message in serial["messages"] if
+                        message["type"] == "error")), 1)
+            assert serial["partial"]
+            with patch("multiprocessing.Pool", LazyPool):
+                with patch("appvalidator.testcases.content."
+                           "_analyze_in_worker", analyze):
+                    eq_(run(2), serial)
+            eq_(len(analyzed), 1)
+        finally:
+            shutil.rmtree(path)
+
+    def test_parallel_web_app(self):
+        """Test that worker processes test the files of a web app as a web
+        app, so that CSP violations are warnings, as they are in serial
+        mode."""
+
+        path = tempfile.mkdtemp()
+        try:
+            app = make_webapp(os.path.join(path, "app.zip"), "web")
+
+            def run(workers):
+                return comparable_findings(json.loads(
+                    validate_packaged_app(app, listed=False,
+                                         workers=workers)))
+
+            serial = run(None)
+            eq_(serial["errors"], 0)
+            assert any(message["id"][0] == "csp" for
+                       message in serial["messages"])
+            eq_(run(2), serial)
+        finally:
+            shutil.rmtree(path)
+
+
+class LazyPool(object):
+    """Stands in for a pool of worker processes. Each job is taken and run
+    when its result is asked for."""
+
+    def __init__(self, workers):
+        pass
+
+    def imap_unordered(self, func, jobs):
+        results = (func(job) for job in jobs)
+        return Mock(next=lambda timeout: next(results))
+
+    def close(self):
+        pass
+
+    terminate = join = close
+
 
 class TestCordova(TestCase):
 
@@ -2,7 +2,9 @@ from nose.tools import eq_
 
 from helper import TestCase
 
-from appvalidator.contextgenerator import ContextGenerator
+from appvalidator.contextgenerator import (ContextGenerator,
+                                          get_context_generator)
+from appvalidator.errorbundle import ErrorBundle
 
 
 class TestContextGenerator(TestCase):
@@ -109,3 +111,32 @@ class TestContextGenerator(TestCase):
             ' One\n'
             ' One',
             ('None', ' One', ' One'))
+
+    def test_get_line_matches_lines(self):
+        """Test that every position maps to the line that contains it."""
+
+        d = "abc\n\ndef\nghij\n\n"
+        c = ContextGenerator(d)
+        eq_(list(c.data), d.split("\n"))
+        eq_([c.data[i] for i in range(len(c.data))], d.split("\n"))
+        eq_(c.data[-1], "")
+
+        line, line_end = 1, len(d.split("\n")[0])
+        for position in range(len(d) + 2):
+            if position > line_end and line < len(c.data):
+                line += 1
+                line_end += len(d.split("\n")[line - 1]) + 1
+            eq_(c.get_line(position), line)
+
+    def test_cached_generators(self):
+        """Test that the same data shares a single context generator within
+        a bundle, but not across bundles."""
+
+        err = ErrorBundle()
+        d = "foo\nbar"
+        c = get_context_generator(d, err)
+        assert get_context_generator(d, err) is c
+        assert get_context_generator("foo\nbaz", err) is not c
+        assert get_context_generator(d, err.spawn()) is not c
+        assert get_context_generator(d, ErrorBundle()) is not c
+        assert get_context_generator(d) is not c
@@ -1,3 +1,4 @@
+import pickle
 import sys
 from StringIO import StringIO
 
@@ -188,3 +189,118 @@ class TestErrorBundle(ErrorBundleTestCase):
                 assert m["column"] > -1
             else:
                 assert m["column"] is None
+
+    def test_duplicates(self):
+        """Test that duplicate messages are only recorded once."""
+
+        self.err.warning(("a", "b"), "warning", "", "file", 1, 2)
+        self.err.warning(("a", "b"), "another", "", "file", 1, 2)
+        self.err.warning(("a", "b"), "warning", "", "file", 2, 2)
+        self.err.error(("a", "b"), "error", "", "file", 1, 2)
+
+        eq_(len(self.err.warnings), 2)
+        eq_(len(self.err.errors), 1)
+        eq_(self.err.message_count, 3)
+
+    def test_discard_unused_messages(self):
+        """Test that messages above the ending tier are discarded and that
+        the remaining messages keep their order."""
+
+        self.err.set_tier(1)
+        self.err.error(("a", ), "first")
+        self.err.set_tier(2)
+        self.err.error(("b", ), "second")
+        self.err.error(("c", ), "third")
+        self.err.warning(("d", ), "fourth")
+        self.err.set_tier(1)
+        self.err.error(("e", ), "fifth")
+        self.err.notice(("f", ), "sixth", tier=3)
+
+        eq_([m["message"] for m in self.err.errors],
+            ["first", "second", "third", "fifth"])
+
+        self.err.discard_unused_messages(ending_tier=1)
+
+        eq_([m["message"] for m in self.err.errors], ["first", "fifth"])
+        assert not self.err.warnings
+        assert not self.err.notices
+
+        results = self.get_json_results()
+        eq_(results["errors"], 2)
+        eq_(results["warnings"], 0)
+        eq_(len(results["messages"]), 2)
+
+        # Discarded messages may be raised again.
+        self.err.error(("b", ), "second")
+        eq_(len(self.err.errors), 3)
+
+    def test_merge(self):
+        """Test that serialized bundles can be merged deterministically."""
+
+        first = ErrorBundle()
+        first.error(("a", ), "first", filename="foo.js", line=1)
+        first.metadata["ran_js_tests"] = "yes"
+        first.metadata["nested"] = {"a": 1}
+        first.feature_profile.add("FOO")
+        first.feature_usage["FOO"].append({"file": "foo.js"})
+
+        second = ErrorBundle()
+        second.set_tier(3)
+        second.error(("a", ), "first", filename="foo.js", line=1)
+        second.warning(("b", ), "second", filename="bar.js", line=2)
+        second.metadata["nested"] = {"b": 2}
+        second.save_resource("foo", "bar")
+        second.feature_profile.add("FOO")
+        second.feature_usage["FOO"].append({"file": "bar.js"})
+
+        # The serialized state must survive a trip to another process.
+        first = pickle.loads(pickle.dumps(first.serialize()))
+        second = pickle.loads(pickle.dumps(second.serialize()))
+
+        self.err.set_tier(2)
+        self.err.merge(first).merge(second)
+
+        eq_(len(self.err.errors), 1)
+        eq_(self.err.errors[0]["tier"], 1)
+        eq_(self.err.warnings[0]["tier"], 3)
+        eq_(self.err.tier, 2)
+        eq_(self.err.ending_tier, 3)
+        eq_(self.err.metadata["ran_js_tests"], "yes")
+        eq_(self.err.metadata["nested"], {"a": 1, "b": 2})
+        eq_(self.err.get_resource("foo"), "bar")
+        eq_(self.err.feature_profile, set(["FOO"]))
+        eq_([u["file"] for u in self.err.feature_usage["FOO"]],
+            ["foo.js", "bar.js"])
+
+        other = ErrorBundle()
+        other.merge(self.err)
+        eq_(json.loads(other.render_json())["messages"],
+            self.get_json_results()["messages"])
+
+    def test_spawn(self):
+        """Test that spawned bundles share the settings and resources of
+        their parent, but collect their own findings."""
+
+        self.err.fail_fast = True
+        self.err.set_tier(2)
+        self.err.save_resource("foo", "bar")
+        self.err.metadata["parent"] = True
+
+        child = self.err.spawn()
+        eq_(child.tier, 2)
+        assert child.fail_fast
+        eq_(child.get_resource("foo"), "bar")
+        eq_(child.metadata, {})
+
+        child.set_tier(3)
+        child.error(("a", ), "error", filename="foo.js")
+        child.metadata["child"] = True
+        state = child.serialize()
+        assert "resources" not in state
+
+        self.err.merge(state)
+        eq_(len(self.err.errors), 1)
+        eq_(self.err.errors[0]["tier"], 3)
+        eq_(self.err.tier, 2)
+        eq_(self.err.ending_tier, 3)
+        eq_(self.err.metadata, {"parent": True, "child": True})
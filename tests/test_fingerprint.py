@@ -0,0 +1,129 @@
+import os
+import shutil
+import tempfile
+
+from mock import patch
+from nose.tools import eq_
+
+from appvalidator.fingerprint import (ANCHOR_SIZE, blank_regions,
+                                      fingerprint, FingerprintIndex,
+                                      normalize, read_fingerprints,
+                                      write_fingerprints)
+
+
+LIBRARY = u"""
+/*! Widget v1.2.3 | (c) Widget authors */
+(function (window, undefined) {
+    // Comments and whitespace don't matter.
+    var widget = function (selector) {
+        return new widget.init(selector);
+    };
+    widget.pattern = /\\/*[a-z]+/g;
+    widget.count = 1 + +window.length;
+    window.widget = widget;
+})(window);
+"""
+
+
+def test_normalize():
+    normalized, segments = normalize(LIBRARY)
+    eq_(normalized,
+        u"(function(window,undefined){var widget=function(selector){"
+        u"return new widget.init(selector);};widget.pattern=/\\/*[a-z]+/g;"
+        u"widget.count=1+ +window.length;window.widget=widget;})(window);")
+
+
+def test_normalize_strings():
+    """Test that strings and regular expressions are kept as they are."""
+    eq_(normalize(u"a = '  /* b */  ';")[0], u"a='  /* b */  ';")
+    eq_(normalize(u"a = \"// b\" // c")[0], u"a=\"// b\"")
+    eq_(normalize(u"return /a b/ / c")[0], u"return/a b//c")
+    eq_(normalize(u"a / b / c")[0], u"a/b/c")
+
+
+def test_fingerprint():
+    """Test that the fingerprint of a library doesn't depend on its
+    comments or formatting."""
+    original = fingerprint("widget", "1.2.3", LIBRARY)
+    eq_(original.size, len(normalize(LIBRARY)[0]))
+    eq_(original.anchor, normalize(LIBRARY)[0][:ANCHOR_SIZE])
+
+    modified = LIBRARY.replace("1.2.3", "1.2.4").replace("    ", "\t")
+    modified += "//# sourceMappingURL=widget.map\n"
+    eq_(fingerprint("widget", "1.2.3", modified), original)
+    assert (fingerprint("widget", "1.2.3", LIBRARY.replace("1 +", "2 +")) !=
+            original)
+
+
+def test_blank_regions():
+    data = u"abc\ndef\nghi"
+    eq_(blank_regions(data, [(1, 2)]), u"a c\ndef\nghi")
+    eq_(blank_regions(data, [(1, 6), (9, 10)]), u"a\n  f\ng i")
+
+
+class TestFingerprintIndex(object):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.index_path = os.path.join(self.path, "hashes.json")
+        write_fingerprints([fingerprint("widget", "1.2.3", LIBRARY)],
+                           self.index_path)
+        self.index = FingerprintIndex(self.index_path)
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_read_write(self):
+        eq_(read_fingerprints(self.index_path),
+            [fingerprint("widget", "1.2.3", LIBRARY)])
+
+    def test_whole(self):
+        data = "/* Modified */" + LIBRARY.replace("\n", "\n  ")
+        found = self.index.find(data)
+        eq_([(library.name, library.version, start, end) for
+             library, start, end in found],
+            [("widget", "1.2.3", 0, len(data))])
+
+    def test_bundle(self):
+        """Test that libraries are found within bundles, and that their
+        regions are mapped back to the original script."""
+        before = u"var app = {};\nfunction start() { app.run(); }\n"
+        after = u"\nstart();\n"
+        data = before + LIBRARY + LIBRARY + after
+
+        found = self.index.find(data)
+        eq_(len(found), 2)
+        first, second = [(start, end) for library, start, end in found]
+        eq_(data[first[0]:first[1]],
+            LIBRARY[LIBRARY.index("(function"):LIBRARY.rindex(";") + 1])
+        eq_(data[second[0]:second[1]], data[first[0]:first[1]])
+
+        blanked = blank_regions(data, [first, second])
+        eq_(blanked.count("\n"), data.count("\n"))
+        eq_(normalize(blanked)[0],
+            u"var app={};function start(){app.run();}start();")
+        eq_(blanked.splitlines()[-1], u"start();")
+
+    def test_not_found(self):
+        eq_(self.index.find(u"var app = {};"), [])
+        eq_(self.index.find(LIBRARY.replace("1 +", "2 +")), [])
+        eq_(self.index.find(u""), [])
+
+    def test_prefilter(self):
+        """Test that scripts which can't hold any of the libraries aren't
+        normalized."""
+        with patch("appvalidator.fingerprint.normalize",
+                   wraps=normalize) as normalize_:
+            eq_(self.index.find(u"var app = {};"), [])
+            eq_(self.index.find(u"var app = {};\n" * 1000), [])
+            assert not normalize_.called
+
+            # The words of a library are still found when the library has
+            # been reformatted.
+            data = u"var app = {};\n" * 1000 + LIBRARY.replace("    ", "\t")
+            eq_(len(self.index.find(data)), 1)
+            assert normalize_.called
+
+    def test_empty(self):
+        write_fingerprints([], self.index_path)
+        eq_(FingerprintIndex(self.index_path).find(LIBRARY), [])
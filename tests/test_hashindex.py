@@ -0,0 +1,98 @@
+import hashlib
+import os
+import shutil
+import tempfile
+
+from mock import patch
+from nose.tools import eq_, raises
+
+from appvalidator.hashindex import HashIndex, whitelist_type, write_index
+import appvalidator.testcases.content as content
+
+
+def digest(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+class TestHashIndex(object):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.index_path = os.path.join(self.path, "hashes.idx")
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def get_index(self, digests):
+        write_index(digests, self.index_path)
+        return HashIndex(self.index_path)
+
+    def test_contains(self):
+        digests = [digest(str(i)) for i in range(1000)]
+        index = self.get_index(digests)
+        eq_(len(index), 1000)
+        for d in digests:
+            assert d in index
+            assert d.upper() in index
+        for i in range(1000, 2000):
+            assert digest(str(i)) not in index
+
+    def test_empty(self):
+        index = self.get_index([])
+        eq_(len(index), 0)
+        assert digest("foo") not in index
+
+    def test_duplicates(self):
+        eq_(len(self.get_index([digest("foo")] * 3)), 1)
+
+    def test_not_digests(self):
+        index = self.get_index([digest("foo")])
+        assert None not in index
+        assert "foo" not in index
+        assert "z" * 64 not in index
+
+    def test_lazy(self):
+        """Test that the index isn't mapped until it is used."""
+        index = HashIndex(os.path.join(self.path, "missing.idx"))
+        write_index([digest("foo")], index.path)
+        assert digest("foo") in index
+
+    def test_bloom(self):
+        """Test that digests rejected by the bloom filter aren't searched
+        for."""
+        index = self.get_index([digest(str(i)) for i in range(100)])
+        with patch.object(HashIndex, "_search") as search:
+            for i in range(100, 200):
+                assert digest(str(i)) not in index
+            # A handful of false positives are expected.
+            assert search.call_count < 10
+
+    @raises(ValueError)
+    def test_bad_file(self):
+        with open(self.index_path, "wb") as file_:
+            file_.write("foo bar baz")
+        digest("foo") in HashIndex(self.index_path)
+
+    @raises(ValueError)
+    def test_truncated(self):
+        write_index([digest("foo"), digest("bar")], self.index_path)
+        with open(self.index_path, "r+b") as file_:
+            file_.truncate(os.path.getsize(self.index_path) - 1)
+        digest("foo") in HashIndex(self.index_path)
+
+
+def test_whitelist_type():
+    eq_(whitelist_type("lib/jquery.js"), "js")
+    eq_(whitelist_type("style/Bootstrap.CSS"), "css")
+    eq_(whitelist_type("index.html"), "markup")
+    eq_(whitelist_type("icon.png"), None)
+
+
+def test_shipped_index():
+    """Test that the shipped index holds every hash in hashes.txt."""
+    path = os.path.join(os.path.dirname(content.__file__), "hashes.txt")
+    with open(path) as listing:
+        hashes = set(line.split()[0] for line in listing if line.strip())
+    eq_(len(content.hashes_whitelist["js"]), len(hashes))
+    for hash in hashes:
+        assert hash in content.hashes_whitelist["js"]
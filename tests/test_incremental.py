@@ -0,0 +1,166 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+from mock import patch
+from nose.tools import assert_raises, eq_
+
+from helper import make_webapp, TestCase
+
+from appvalidator import validate_packaged_app
+from appvalidator.incremental import (Artifact, comparable_findings,
+                                      IncrementalMismatch)
+import appvalidator.testcases.content as content
+
+PACKAGE = "tests/resources/packaged_app.zip"
+LIBRARY = "var foo = 1;"
+
+
+def validate(**kwargs):
+    """Validate the test package, returning its results without the parts
+    that differ from run to run."""
+    return comparable_findings(json.loads(
+        validate_packaged_app(PACKAGE, listed=False, **kwargs)))
+
+
+class TestIncremental(TestCase):
+
+    def setUp(self):
+        super(TestIncremental, self).setUp()
+        self.artifact = Artifact()
+        self.full = validate(artifact=self.artifact)
+
+    def test_recorded(self):
+        """Test that the findings of each file are recorded."""
+        eq_(self.artifact.reused, 0)
+        eq_(self.artifact.members["script.js"][2], True)
+        assert self.artifact.members["script.js"][3]["messages"]["warnings"]
+        eq_(self.artifact.members["icons/16.png"][2:], (False, None, None))
+
+    def test_reused(self):
+        """Test that the findings of unchanged files are reused, and that
+        the results are the same as those of a full run."""
+        artifact = Artifact.loads(self.artifact.dumps())
+        eq_(validate(artifact=artifact), self.full)
+        eq_(artifact.reused, len(self.artifact.members))
+        eq_(validate(), self.full)
+
+    def test_changed(self):
+        """Test that the findings of changed files are not reused."""
+        crc, size, processed, findings, whitelisted = (
+            self.artifact.members["script.js"])
+        self.artifact.members["script.js"] = (crc + 1, size, processed, None,
+                                              whitelisted)
+        eq_(validate(artifact=self.artifact), self.full)
+        eq_(self.artifact.reused, len(self.artifact.members) - 1)
+        eq_(self.artifact.members["script.js"][0], crc)
+
+    def test_options(self):
+        """Test that findings made with other options are not reused."""
+        validate_packaged_app(PACKAGE, listed=True, artifact=self.artifact)
+        eq_(self.artifact.reused, 0)
+
+    def test_verify(self):
+        """Test that verify mode checks the replayed findings."""
+        self.artifact.verify = True
+        eq_(validate(artifact=self.artifact), self.full)
+
+        self.artifact.members["script.js"][3]["messages"]["warnings"] = []
+        with assert_raises(IncrementalMismatch):
+            validate(artifact=self.artifact)
+
+
+class TestAppType(TestCase):
+
+    def setUp(self):
+        super(TestAppType, self).setUp()
+        self.path = tempfile.mkdtemp()
+        self.artifact = Artifact()
+        self.validate_app("privileged")
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def validate_app(self, app_type, **kwargs):
+        path = make_webapp(os.path.join(self.path, "%s.zip" % app_type),
+                           app_type)
+        return comparable_findings(json.loads(validate_packaged_app(
+            path, listed=False, artifact=self.artifact, **kwargs)))
+
+    def test_app_type(self):
+        """Test that findings aren't reused once the type of app changes,
+        even though the files that they were found in haven't."""
+        full = json.loads(validate_packaged_app(
+            make_webapp(os.path.join(self.path, "full.zip"), "web"),
+            listed=False))
+        eq_(full["errors"], 0)
+
+        results = self.validate_app("web")
+        eq_(self.artifact.reused, 0)
+        eq_(results["errors"], full["errors"])
+        eq_(results["warnings"], full["warnings"])
+
+    def test_app_type_verify(self):
+        """Test that verify mode doesn't compare findings made for another
+        type of app."""
+        self.artifact.verify = True
+        eq_(self.validate_app("web")["errors"], 0)
+
+
+def test_options_changed():
+    """Test that verify mode notices the options changing while the findings
+    are recorded."""
+    artifact = Artifact(verify=True)
+    artifact.begin({"app_type": "privileged"})
+    with assert_raises(IncrementalMismatch):
+        artifact.finish({"app_type": "web"})
+
+
+def test_old_format():
+    """Test that artifacts saved in an older format are loaded empty."""
+    artifact = Artifact.loads(json.dumps(
+        {"options": {}, "members": {"script.js": [1, 2, True, None]}}))
+    eq_(artifact.members, {})
+    eq_(artifact.options, None)
+
+
+class TestWhitelisted(TestCase):
+
+    def setUp(self):
+        super(TestWhitelisted, self).setUp()
+        self.path = tempfile.mkdtemp()
+        self.app = make_webapp(os.path.join(self.path, "app.zip"),
+                               files={"lib.js": LIBRARY})
+        self.whitelist = patch.dict(
+            content.hashes_whitelist,
+            {"js": set([hashlib.sha256(LIBRARY).hexdigest()])})
+        self.whitelist.start()
+        self.artifact = Artifact()
+
+    def tearDown(self):
+        self.whitelist.stop()
+        shutil.rmtree(self.path)
+
+    def validate(self):
+        results = json.loads(validate_packaged_app(
+            self.app, listed=False, artifact=self.artifact))
+        return results["metadata"].get("whitelisted_files")
+
+    def test_replayed(self):
+        """Test that unchanged whitelisted files are counted, though they
+        aren't hashed again."""
+        full = self.validate()
+        eq_(full, {"js": {"files": 1, "size": len(LIBRARY)}})
+        eq_(self.validate(), full)
+        eq_(self.artifact.reused, len(self.artifact.members))
+
+    def test_verify(self):
+        """Test that verify mode checks whether files were whitelisted."""
+        self.validate()
+        self.artifact.verify = True
+        entry = self.artifact.members["lib.js"]
+        self.artifact.members["lib.js"] = entry[:4] + (None, )
+        with assert_raises(IncrementalMismatch):
+            self.validate()
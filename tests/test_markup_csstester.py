@@ -1,3 +1,6 @@
+from mock import patch
+from nose.tools import eq_
+
 import appvalidator.testcases.markup.csstester as csstester
 from appvalidator.errorbundle import ErrorBundle
 
@@ -44,3 +47,98 @@ def test_remote_urls():
 
     assert not t("UrL(/abc.def)")
     assert t("url(HTTP://foo.bar/)")
+    assert t("url( 'https://foo.bar/baz.png?size=1' )")
+
+
+def _scan(data, **kwargs):
+    err = ErrorBundle()
+    csstester.test_css_file(err, "css.css", data, **kwargs)
+    return err
+
+
+def test_remote_url_notice():
+    "Tests that remote url() references are reported on their lines."
+
+    err = _scan("a {\n  color: red;\n}\n"
+                "b {\n  background: url(\"https://foo.bar/baz.png\");\n}\n")
+    assert not err.failed()
+    eq_(len(err.notices), 1)
+    eq_(err.notices[0]["id"][2], "remote_url")
+    eq_(err.notices[0]["line"], 5)
+    assert "https://foo.bar/baz.png" in err.notices[0]["description"][1]
+
+
+def test_remote_url_line_start():
+    "Tests that the lines of embedded CSS are relative to the document."
+
+    err = _scan("\nb { background: url(//foo.bar/baz.png); }", line_start=10)
+    eq_(err.notices[0]["line"], 11)
+
+
+def test_remote_url_snippet():
+    "Tests that the lines of snippets are those of their attribute."
+
+    err = ErrorBundle()
+    csstester.test_css_snippet(err, "foo.html",
+                               "background: url(http://foo.bar/)", 7)
+    eq_(err.notices[0]["line"], 7)
+
+
+def test_local_urls():
+    "Tests that local and commented out references aren't reported."
+
+    err = _scan("/* url(http://foo.bar/) */\n"
+                "a { content: \"url(http://foo.bar/)\"; }\n"
+                "b { background: url(images/foo.png); }\n"
+                "c { -moz-binding: url(chrome://foo/content/bar.xml); }")
+    eq_(err.notices, [])
+
+
+def test_tokenize_flag():
+    "Tests that CSS is only tokenized when it is asked for."
+
+    with patch.object(csstester.cssutils.tokenize2, "Tokenizer") as tokenizer:
+        _scan("a { color: red; }")
+        assert not tokenizer.called
+
+    err = ErrorBundle()
+    err.save_resource("css_tokenize", True)
+    with patch.object(csstester, "_run_css_tests") as run_css_tests:
+        csstester.test_css_file(err, "css.css", u"a { content: \"\u2603\"; }")
+        assert run_css_tests.called
+
+
+def test_snippets_batched():
+    "Tests that the findings in a batch of snippets are on their own lines."
+
+    err = ErrorBundle()
+    csstester.test_css_snippets(err, "foo.html", [
+        ("background: url(http://foo.bar/)", 3),
+        ("color: red; /* unclosed", 8),
+        ("color: red;\nbackground: url('//foo.bar/')", 20),
+        ("background: url(foo.png)", 25),
+    ])
+    eq_([notice["line"] for notice in err.notices], [3, 21])
+
+
+def test_snippets_tokenized_once():
+    "Tests that a batch of snippets is tokenized in one go."
+
+    err = ErrorBundle()
+    err.save_resource("css_tokenize", True)
+    with patch.object(csstester, "_run_css_tests") as run_css_tests:
+        csstester.test_css_snippets(err, "foo.html", [
+            ("color: red", 3),
+            ("color: red;\nbackground: blue", 8),
+        ])
+    eq_(run_css_tests.call_count, 1)
+    line_map = run_css_tests.call_args[1]["line_map"]
+    eq_([line_map(line) for line in (1, 3, 4)], [3, 8, 9])
+
+
+def test_snippets_empty():
+    "Tests that a document without style attributes is left alone."
+
+    err = ErrorBundle()
+    csstester.test_css_snippets(err, "foo.html", [])
+    eq_(err.notices, [])
@@ -233,3 +233,41 @@ def test_script_scraping():
 def test_valueless_attribute():
     """Test that valueless attributes generate no errors."""
     _test_xul_raw("<foo bar />", "foo.xul", should_fail=False)
+
+
+def test_style_attributes_batched():
+    """Test that the style attributes of a document are tested together, and
+    that their findings are reported on their own lines."""
+
+    err = ErrorBundle()
+    parser = markuptester.MarkupParser(err, debug=True)
+    with patch.object(markuptester.csstester, "test_css_snippets",
+                      wraps=markuptester.csstester.test_css_snippets) as test:
+        parser.process("foo.html", """<html>
+        <div style="color: red">
+        <div style="background: url(img/foo.png)"></div>
+        <div style="color: blue;
+                    background: url(https://foo.bar/baz.png)"></div>
+        </div>
+        </html>""", "html")
+        eq_(test.call_count, 1)
+        eq_(len(test.call_args[0][2]), 3)
+
+    eq_(len(err.notices), 1)
+    eq_(err.notices[0]["id"][2], "remote_url")
+    eq_(err.notices[0]["line"], 5)
+
+
+def test_style_attribute_line():
+    """Test that the line of a style attribute isn't taken from text within
+    the value of another attribute."""
+
+    err = ErrorBundle()
+    parser = markuptester.MarkupParser(err, debug=True)
+    parser.process("foo.html", """<html>
+    <div title="a style=b"
+         style="background: url(https://foo.bar/baz.png)"></div>
+    </html>""", "html")
+
+    eq_(len(err.notices), 1)
+    eq_(err.notices[0]["line"], 3)
@@ -22,7 +22,7 @@ def test_blacklisted_magic_numbers():
     "Tests that blacklisted magic numbers are banned"
 
     err = _do_test("tests/resources/packagelayout/magic_number.xpi",
-                   packagelayout.test_blacklisted_files,
+                   packagelayout.test_magic_numbers,
                    True)
     assert err.metadata["contains_binary_content"]
     assert "binary_components" not in err.metadata
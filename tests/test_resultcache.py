@@ -0,0 +1,253 @@
+import json
+import os
+import shutil
+import tempfile
+import time
+
+from mock import patch
+from nose.tools import eq_
+
+from helper import make_webapp, MockXPI, TestCase
+
+from appvalidator import validate_app, validate_packaged_app
+from appvalidator.incremental import comparable_findings
+from appvalidator.resultcache import (cache_key, FileSystemStore,
+                                      FindingsCache, rename_findings,
+                                      SQLiteStore)
+from appvalidator.submain import ValidationTimeout
+import appvalidator.testcases.content as content
+from appvalidator.zip import DecompressionLimitExceeded
+
+
+class StoreTests(object):
+    """Tests which are shared by every kind of result store."""
+
+    def test_get_set(self):
+        store = self.get_store()
+        eq_(store.get("foo"), None)
+        store.set("foo", "bar")
+        eq_(store.get("foo"), "bar")
+        store.set("foo", "baz")
+        eq_(store.get("foo"), "baz")
+
+    def test_ttl(self):
+        store = self.get_store(ttl=60)
+        store.set("foo", "bar")
+        with patch("time.time", return_value=time.time() + 120):
+            eq_(store.get("foo"), None)
+
+        # Expired results are gone for good.
+        eq_(store.get("foo"), None)
+
+    def test_eviction(self):
+        store = self.get_store(max_size=10)
+        now = time.time()
+        with patch("time.time", return_value=now - 3):
+            store.set("first", "x" * 4)
+        with patch("time.time", return_value=now - 2):
+            store.set("second", "x" * 4)
+        with patch("time.time", return_value=now - 1):
+            # Using a result makes it the most recently used.
+            eq_(store.get("first"), "x" * 4)
+        store.set("third", "x" * 4)
+
+        eq_(store.get("second"), None)
+        eq_(store.get("first"), "x" * 4)
+        eq_(store.get("third"), "x" * 4)
+
+
+class TestFileSystemStore(StoreTests, TestCase):
+
+    def setUp(self):
+        super(TestFileSystemStore, self).setUp()
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def get_store(self, **kwargs):
+        return FileSystemStore(os.path.join(self.path, "cache"), **kwargs)
+
+    def test_ttl(self):
+        store = self.get_store(ttl=60)
+        store.set("foo", "bar")
+        filename = os.path.join(self.path, "cache", "foo.json")
+        os.utime(filename, (time.time(), time.time() - 120))
+        eq_(store.get("foo"), None)
+        assert not os.path.exists(filename)
+
+    def test_eviction(self):
+        store = self.get_store(max_size=10)
+        store.set("first", "x" * 4)
+        store.set("second", "x" * 4)
+        filename = os.path.join(self.path, "cache", "%s.json")
+        now = time.time()
+        os.utime(filename % "first", (now - 1, now - 3))
+        os.utime(filename % "second", (now - 2, now - 2))
+        store.set("third", "x" * 4)
+
+        eq_(store.get("second"), None)
+        eq_(store.get("first"), "x" * 4)
+        eq_(store.get("third"), "x" * 4)
+
+    def test_eviction_listing(self):
+        """Test that the store is only listed when it's over its budget."""
+        store = self.get_store(max_size=10)
+        with patch("os.listdir", wraps=os.listdir) as listdir:
+            store.set("first", "x" * 4)
+            store.set("first", "x" * 4)
+            store.set("second", "x" * 4)
+            assert not listdir.called
+            store.set("third", "x" * 4)
+            eq_(listdir.call_count, 1)
+        eq_(store.size, 8)
+
+
+class TestSQLiteStore(StoreTests, TestCase):
+
+    def setUp(self):
+        super(TestSQLiteStore, self).setUp()
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def get_store(self, **kwargs):
+        return SQLiteStore(os.path.join(self.path, "cache.db"), **kwargs)
+
+    def test_persistent(self):
+        self.get_store().set("foo", "bar")
+        eq_(self.get_store().get("foo"), "bar")
+
+
+class TestValidateCache(TestCase):
+
+    def setUp(self):
+        super(TestValidateCache, self).setUp()
+        self.path = tempfile.mkdtemp()
+        self.store = FileSystemStore(self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_key(self):
+        eq_(cache_key("abc", listed=True, acorn=False),
+            cache_key("abc", acorn=False, listed=True))
+        assert (cache_key("abc", listed=True) !=
+                cache_key("abc", listed=False))
+        assert cache_key("abc") != cache_key("abd")
+
+    def test_packaged_app(self):
+        """Test that packaged app results are served from the cache."""
+        path = "tests/resources/packaged_app.zip"
+        output = validate_packaged_app(path, listed=False, cache=self.store)
+
+        with patch("appvalidator.submain.prepare_package") as prepare:
+            eq_(validate_packaged_app(path, listed=False, cache=self.store),
+                output)
+            assert not prepare.called
+
+            # Different options don't share results.
+            validate_packaged_app(path, listed=True, cache=self.store)
+            assert prepare.called
+
+    def test_interrupted_not_cached(self):
+        """Test that validations which were cut short aren't cached."""
+        path = "tests/resources/packaged_app.zip"
+        with patch("appvalidator.submain.test_inner_package",
+                   side_effect=ValidationTimeout(1)):
+            output = validate_packaged_app(path, listed=False,
+                                           cache=self.store)
+        assert "timeout" in output
+        eq_(os.listdir(self.path), [])
+
+        with patch("appvalidator.submain.test_inner_package",
+                   side_effect=DecompressionLimitExceeded("Too large")):
+            validate_packaged_app(path, listed=False, cache=self.store)
+        eq_(os.listdir(self.path), [])
+
+    def test_bundle_not_cached(self):
+        """Test that only JSON results are cached."""
+        path = "tests/resources/packaged_app.zip"
+        validate_packaged_app(path, listed=False, format=None,
+                              cache=self.store)
+        eq_(os.listdir(self.path), [])
+
+    def test_app(self):
+        """Test that hosted app results are served from the cache."""
+        with open("tests/resources/testwebapp.webapp") as file_:
+            data = file_.read()
+        output = validate_app(data, cache=self.store)
+
+        with patch("appvalidator.webapp.detect_webapp_string") as detect:
+            eq_(validate_app(data, cache=self.store), output)
+            assert not detect.called
+
+
+class TestFindingsCache(TestCase):
+
+    def setUp(self):
+        super(TestFindingsCache, self).setUp()
+        self.path = tempfile.mkdtemp()
+        self.store = FileSystemStore(self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_shared(self):
+        """Test that the findings for a file are replayed for other files
+        with the same content, under their own names."""
+        self.setup_err()
+        findings_cache = FindingsCache(self.store)
+        self.err.save_resource("findings_cache", findings_cache)
+
+        xml = "tests/resources/markup/markuptester/bad_nesting.xml"
+        package = MockXPI({"a.xml": xml, "b.xml": xml})
+        eq_(content.test_packed_packages(self.err, package), 2)
+        eq_(findings_cache.misses, 1)
+        eq_(findings_cache.hits, 1)
+
+        messages = self.err.errors + self.err.warnings
+        eq_(sorted(m["file"] for m in messages), ["a.xml", "b.xml"])
+        a, b = sorted(messages, key=lambda m: m["file"])
+        eq_(a["id"], b["id"])
+        eq_(a["line"], b["line"])
+        assert a["uid"] != b["uid"]
+
+    def test_packaged_app(self):
+        """Test that cached findings give the same results as a full
+        run."""
+        path = "tests/resources/packaged_app.zip"
+
+        def validate(**kwargs):
+            return comparable_findings(json.loads(
+                validate_packaged_app(path, listed=False, **kwargs)))
+
+        full = validate()
+        eq_(validate(findings_cache=self.store), full)
+        assert os.listdir(self.path)
+        eq_(validate(findings_cache=self.store), full)
+
+    def test_app_type(self):
+        """Test that findings made for one type of app aren't replayed for
+        another."""
+        def validate(app_type, **kwargs):
+            path = make_webapp(os.path.join(self.path, "app.zip"), app_type)
+            return json.loads(validate_packaged_app(path, listed=False,
+                                                    **kwargs))
+
+        full = validate("web")
+        eq_(full["errors"], 0)
+        validate("privileged", findings_cache=self.store)
+        results = validate("web", findings_cache=self.store)
+        eq_(results["errors"], full["errors"])
+        eq_(results["warnings"], full["warnings"])
+
+    def test_rename_libraries(self):
+        """Test that the libraries found in a file are listed under its new
+        name."""
+        libraries = [{"name": "jquery", "version": "1.6.4"}]
+        findings = {"messages": {}, "feature_usage": {},
+                    "metadata": {"libraries": {"a.js": libraries}}}
+        eq_(rename_findings(findings, "b.js")["metadata"],
+            {"libraries": {"b.js": libraries}})
@@ -103,11 +103,14 @@ class MockTestcases:
 
 class MockErrorHandler:
 
-    def __init__(self, mock_decorator, determined=False):
+    def __init__(self, mock_decorator, determined=False, fail_fast=False):
         self.decorator = mock_decorator
         self.detected_type = 0
         self.has_failed = False
         self.determined = determined
+        self.fail_fast = fail_fast
+        self.max_tier = None
+        self.unfinished = False
 
         self.pushable_resources = {}
         self.resources = {}
@@ -134,6 +137,12 @@ class MockErrorHandler:
         "Simple accessor because the standard error handler has one"
         return self.has_failed
 
+    def should_halt(self):
+        "Simple accessor because the standard error handler has one"
+        if self.fail_fast and self.has_failed:
+            self.unfinished = True
+        return self.unfinished
+
 
 # Test the function of the decorator iterator
 @patch("appvalidator.submain.testcases", MockTestcases())
@@ -175,3 +184,28 @@ def test_inner_package_failtier():
 
     assert err.failed()
     eq_(submain.testcases.last_tier, 5)
+
+
+@patch("appvalidator.submain.testcases", MockTestcases(3, True))
+def test_inner_package_fail_fast():
+    "Tests that fail-fast mode stops at the first failing test"
+
+    err = MockErrorHandler(submain.testcases, True, fail_fast=True)
+    submain.test_inner_package(err, "foo")
+
+    assert err.failed()
+    assert err.unfinished
+    eq_(submain.testcases.last_tier, 2)
+
+
+@patch("appvalidator.submain.testcases", MockTestcases(None, True))
+def test_inner_package_max_tier():
+    "Tests that tiers above the maximum tier are not run"
+
+    err = MockErrorHandler(submain.testcases, True)
+    err.max_tier = 3
+    submain.test_inner_package(err, "foo")
+
+    assert not err.failed()
+    assert err.unfinished
+    eq_(submain.testcases.last_tier, 3)
@@ -0,0 +1,126 @@
+from collections import defaultdict
+import hashlib
+
+from mock import patch
+from nose.tools import eq_
+
+from helper import TestCase
+
+import appvalidator.testcases.content as content
+import appvalidator.testcases.packagelayout as packagelayout
+from appvalidator.sweep import (Consumer, NormalizedHasher, PrefixConsumer,
+                                sweep_package)
+from appvalidator.zip import ZipPackage
+
+
+class CountingConsumer(Consumer):
+
+    def __init__(self):
+        self.chunks = 0
+        self.size = 0
+
+    def feed(self, chunk):
+        self.chunks += 1
+        self.size += len(chunk)
+        self.done = not chunk
+
+    def finish(self):
+        return self.size
+
+
+class TestSweep(TestCase):
+
+    def setUp(self):
+        super(TestSweep, self).setUp()
+        self.package = ZipPackage("tests/resources/packaged_app.zip")
+
+    def test_consumers(self):
+        """Test that consumers receive the data of each member."""
+
+        results = self.package.sweep()
+        eq_(sorted(results), sorted(self.package))
+
+        eq_(results["index.html"]["garbage"], None)
+        eq_(results["icons/256.png"]["sha256"], None)
+
+        # Stylesheets are hashed and held in memory.
+        assert results["style.css"]["sha256"]
+        assert results["style.css"]["cached"]
+
+        # Scripts are hashed but not held in memory.
+        assert results["script.js"]["sha256"]
+        assert not results["script.js"]["cached"]
+        assert "script.js" not in self.package.file_cache
+
+        for name, result in results.items():
+            assert result["error"] is None
+            eq_(result["magic"], self.package.read(name)[:4])
+
+        # The sweep only runs once.
+        assert self.package.sweep() is results
+
+    def test_chunks(self):
+        """Test that members are streamed in chunks."""
+
+        with patch("appvalidator.sweep.SWEEP_CONSUMERS",
+                   [("count", lambda package, info: CountingConsumer()),
+                    ("prefix", lambda package, info: PrefixConsumer(2))]):
+            results = sweep_package(self.package, chunk_size=1024)
+
+        size = self.package.info("icons/256.png")["size"]
+        eq_(results["icons/256.png"]["count"], size)
+        eq_(results["icons/256.png"]["prefix"], "\x89P")
+
+    def test_prefix_only(self):
+        """Test that members are only read as far as their consumers want."""
+
+        reads = []
+        original_open = self.package.open
+
+        def open_(name):
+            stream = original_open(name)
+            read = stream.read
+            stream.read = lambda size=-1: reads.append(size) or read(size)
+            return stream
+
+        with patch("appvalidator.sweep.SWEEP_CONSUMERS",
+                   [("prefix", lambda package, info: PrefixConsumer(4))]):
+            with patch.object(self.package, "open", open_):
+                results = sweep_package(self.package)
+
+        eq_(results["icons/256.png"]["prefix"], "\x89PNG")
+        eq_(set(reads), set([4]))
+
+    def test_normalized_hash(self):
+        """Test that streamed hashes match hashes of the normalized data."""
+
+        data = "a\r\nb\r\r\nc\rd\n\r\n\r"
+        expected = hashlib.sha256(data.replace("\r\n", "\n")).hexdigest()
+        for size in range(1, len(data) + 1):
+            hasher = NormalizedHasher()
+            for i in range(0, len(data), size):
+                hasher.feed(data[i:i + size])
+            hasher.feed("")
+            eq_(hasher.finish(), expected)
+
+    def test_single_inflation(self):
+        """Test that the layout and content tests read each member once,
+        except for .js files which are hashed by the sweep and read again to
+        be analyzed."""
+
+        opened = defaultdict(int)
+        original_open = self.package.open
+
+        def open_(name, *args, **kwargs):
+            opened[name] += 1
+            return original_open(name, *args, **kwargs)
+
+        self.setup_err()
+        with patch.object(self.package, "open", open_):
+            packagelayout.test_magic_numbers(self.err, self.package)
+            with patch("appvalidator.testcases.content._process_file"):
+                content.test_packed_packages(self.err, self.package)
+
+        expected = dict((name, 1) for name in self.package)
+        expected["script.js"] = 2
+        eq_(dict(opened), expected)
@@ -32,3 +32,18 @@ def test_filter_ascii():
                    x in
                    textfilter.filter_ascii([chr(x) for x in range(9)]))
 
+
+def test_filter_ascii_bulk():
+    "Tests that filter_ascii replaces each character on its own"
+
+    def reference(text):
+        return "".join((x if textfilter.is_standard_ascii(x) else "?") for
+                       x in text)
+
+    data = "".join(chr(x) for x in range(256)) * 2
+    assert textfilter.filter_ascii(data) == reference(data)
+    assert isinstance(textfilter.filter_ascii(data), str)
+
+    text = u"t\xe4st\u2603\x00\x7f\t\n" + u"\U0001f600"
+    assert textfilter.filter_ascii(text) == reference(text)
+    assert isinstance(textfilter.filter_ascii(text), unicode)
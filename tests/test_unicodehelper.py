@@ -49,3 +49,36 @@ def test_utf32be():
     "Tests utf-32 Big Endian encoding is properly decoded"
     _do_test("tests/resources/unicodehelper/utf-32be.txt")
 
+
+def test_detect():
+    "Tests that encodings are detected with their confidence"
+    eq_ = nose.tools.eq_
+    eq_(unicodehelper.detect("plain"), ("ascii", 1.0))
+    eq_(unicodehelper.detect("\xef\xbb\xbft\xc3\xa4st"), ("utf-8", 1.0))
+    eq_(unicodehelper.detect("t\xc3\xa4st"), ("utf-8", 0.505))
+    eq_(unicodehelper.detect("t\xc3\xa4st" * 3), ("utf-8", 0.87625))
+    eq_(unicodehelper.detect("t\xc3\xa4st" * 10), ("utf-8", 1.0))
+    eq_(unicodehelper.detect("t\xe4st"), ("latin_1", 0.5))
+    eq_(unicodehelper.detect("t\x91st\x92"), ("latin_1", 0.25))
+
+
+def test_detect_large_utf8():
+    "Tests that a large UTF-8 file is detected with certainty"
+    eq_ = nose.tools.eq_
+    data = ("var greeting = '\xc3\xa4\xe2\x98\x83';\n" +
+            "var x = 1;\n" * 1000) * 100
+    eq_(unicodehelper.detect_and_decode(data),
+        (data.decode("utf-8"), "utf-8", 1.0))
+
+
+def test_detect_split_utf8():
+    "Tests that UTF-8 sequences broken up by ASCII aren't UTF-8"
+    eq_ = nose.tools.eq_
+    eq_(unicodehelper.detect_and_decode("\xc3a\xa4"),
+        (u"\xc3a\xa4", "latin_1", 0.25))
+
+
+def test_unicode():
+    "Tests that unicode data is left alone"
+    nose.tools.eq_(unicodehelper.detect_and_decode(COMPARISON),
+                   (COMPARISON, None, None))
@@ -1,5 +1,8 @@
 import json
 
+from mock import patch
+from nose.tools import eq_
+
 from appvalidator import validate_app, validate_packaged_app
 from helper import safe
 
@@ -28,6 +31,65 @@ def test_packaged_app_bundle():
     out = validate_packaged_app("tests/resources/packaged_app.zip",
                                 listed=False, format=None)
     assert out.get_resource("packaged")
+    assert out.metadata["file_cache"]["misses"]
+
+
+@safe
+def test_webapp_fail_fast():
+    """Test that fail-fast validation of a manifest stops at the first
+    error."""
+    manifest = json.dumps({"name": "x" * 200, "version": 7,
+                           "developer": {"name": "a"},
+                           "default_locale": "en"})
+    j = json.loads(validate_app(manifest, listed=False))
+    assert not j["partial"]
+    assert j["errors"] > 1
+    assert j["warnings"]
+
+    j = json.loads(validate_app(manifest, listed=False, fail_fast=True))
+    assert j["partial"]
+    eq_(j["errors"], 1)
+    eq_(j["warnings"], 0)
+
+
+@safe
+def test_packaged_app_fail_fast():
+    """Test that fail-fast validation stops at the first error."""
+    path = "tests/resources/packagelayout/ext_blacklist.xpi"
+    j = json.loads(validate_packaged_app(path, listed=False))
+    assert not j["partial"]
+    assert j["warnings"] > 1
+
+    j = json.loads(validate_packaged_app(path, listed=False, fail_fast=True))
+    assert j["partial"]
+    eq_(j["errors"], 1)
+    assert not any(m["id"][0] == "testcases_content" for m in j["messages"])
+
+
+@safe
+def test_packaged_app_prescreen():
+    """Test that the pre-screen reports problems without decompressing any
+    file in the package."""
+    path = "tests/resources/packagelayout/ext_blacklist.xpi"
+    with patch("zipfile.ZipFile.open") as zf_open:
+        j = json.loads(validate_packaged_app(path, listed=False,
+                                             prescreen_only=True))
+    eq_(sorted(m["id"][-1] for m in j["messages"]),
+        ["disallowed_extension", "missing_manifest"])
+    assert not zf_open.called
+
+
+@safe
+def test_packaged_app_prescreen_partial():
+    """Test that a pre-screen which finds nothing is marked as partial."""
+    j = json.loads(validate_packaged_app("tests/resources/packaged_app.zip",
+                                         listed=False, prescreen_only=True))
+    assert j["success"]
+    assert j["partial"]
+
+    j = json.loads(validate_packaged_app("tests/resources/packaged_app.zip",
+                                         listed=False))
+    assert not j["partial"]
 
 
 @safe
@@ -54,3 +116,17 @@ def test_server_name_indication():
     # to handle SSL Server Name Indication.
     # See https://bugzilla.mozilla.org/show_bug.cgi?id=875142
     from requests.packages.urllib3.contrib import pyopenssl  # noqa
+
+
+@safe
+def test_packaged_app_workers():
+    """Test that packaged apps can be validated by worker processes."""
+
+    def validate(**kwargs):
+        results = json.loads(validate_packaged_app(
+            "tests/resources/packaged_app.zip", listed=False, **kwargs))
+        for message in results["messages"]:
+            del message["uid"]
+        return results
+
+    eq_(validate(workers=2), validate())
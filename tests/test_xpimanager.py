@@ -1,12 +1,20 @@
 # -*- coding: utf8 -*-
 import os
 import tempfile
+import warnings
+from StringIO import StringIO
+from zipfile import BadZipfile, ZIP_DEFLATED, ZIP_STORED, ZipFile
 
-from nose.tools import eq_, raises
+from mock import patch
+from nose.tools import assert_raises, eq_, raises
 
 from helper import TestCase
 
-from appvalidator.zip import ZipPackage
+from appvalidator.errorbundle import ErrorBundle
+import appvalidator.submain as submain
+from appvalidator.sweep import CHUNK_SIZE
+from appvalidator.zip import (DecompressionLimitExceeded, FileCache,
+                              UNICODE_SIZE, ZipPackage)
 
 RESOURCES_PATH = os.path.join(os.path.dirname(__file__), 'resources')
 
@@ -48,6 +56,27 @@ class TestZipManager(TestCase):
         "Test that the manager can retrieve the correct file name."
         assert 'install.rdf' in self.z.package_contents()
 
+    def test_member_index(self):
+        """Test that the member index describes the package."""
+        assert 'install.rdf' in self.z
+        assert 'foo.bar' not in self.z
+        eq_(list(self.z)[0], 'install.rdf')
+
+        info = self.z.info('install.rdf')
+        zinfo = self.z.zf.getinfo('install.rdf')
+        eq_(info['name_lower'], 'install.rdf')
+        eq_(info['extension'], 'rdf')
+        eq_(info['size'], zinfo.file_size)
+        eq_(info['crc'], zinfo.CRC)
+
+    def test_broken_members(self):
+        """Test that broken files are left out of the index lookups."""
+        self.z.broken_files.add('install.rdf')
+        assert 'install.rdf' not in self.z
+        assert 'install.rdf' not in self.z.package_contents()
+        assert 'install.rdf' not in list(self.z)
+        assert_raises(KeyError, self.z.info, 'install.rdf')
+
     def test_read_file(self):
         """Test that a file can be read from the package."""
         assert self.z.read('install.rdf') is not None
@@ -66,9 +95,285 @@ class TestWriteZip(TestCase):
             finally:
                 os.unlink(temp_fn)
 
+    def test_write_broken(self):
+        """Test that writing a member refreshes the broken file listing."""
+        with tempfile.NamedTemporaryFile(delete=False) as t:
+            temp_fn = t.name
+            try:
+                z = ZipPackage(temp_fn, mode='w')
+                z.write('a.txt', 'foo')
+                z.write('b.txt', 'bar')
+                z.broken_files.add('b.txt')
+                eq_(sorted(z.package_contents()), ['a.txt'])
+
+                z.write('c.txt', 'baz')
+                eq_(sorted(z.package_contents()), ['a.txt', 'c.txt'])
+
+                with warnings.catch_warnings():
+                    # Rewriting a member duplicates its name in the ZIP.
+                    warnings.simplefilter("ignore")
+                    z.write('b.txt', 'qux')
+                assert 'b.txt' in z
+                eq_(sorted(z.package_contents()),
+                    ['a.txt', 'b.txt', 'c.txt'])
+            finally:
+                os.unlink(temp_fn)
+
+
+def make_bomb(size=4 * 1024 * 1024):
+    """Return a ZIP containing a file of zeroes, which compresses at a ratio
+    of roughly 1000:1."""
+    data = StringIO()
+    zf = ZipFile(data, mode="w", compression=ZIP_DEFLATED)
+    zf.writestr("manifest.webapp", "{}")
+    zf.writestr("bomb.txt", "\0" * size)
+    zf.close()
+    data.seek(0)
+    return data
+
+
+class TestDecompressionLimits(TestCase):
+    def test_ratio(self):
+        """Test that compression ratios are checked."""
+        z = ZipPackage(make_bomb(), name="bomb.zip")
+        assert_raises(DecompressionLimitExceeded, z.check_limits)
+        assert_raises(DecompressionLimitExceeded, z.read, "bomb.txt")
+
+        z = ZipPackage(make_bomb(), name="bomb.zip", max_ratio=10000)
+        z.check_limits()
+        eq_(len(z.read("bomb.txt")), 4 * 1024 * 1024)
+
+    def test_sizes(self):
+        """Test that the package and member sizes are checked."""
+        z = ZipPackage(make_bomb(), name="bomb.zip", max_ratio=10000,
+                       max_member_size=1024 * 1024)
+        assert_raises(DecompressionLimitExceeded, z.check_limits)
+
+        z = ZipPackage(make_bomb(), name="bomb.zip", max_ratio=10000,
+                       max_size=1024 * 1024)
+        assert_raises(DecompressionLimitExceeded, z.check_limits)
+
+    def test_streaming(self):
+        """Test that the limits are enforced while decompressing, even if
+        the central directory lies."""
+        z = ZipPackage(make_bomb(), name="bomb.zip")
+        z.members.sizes[1] = 10
+        z.check_limits()
+
+        stream = z.open("bomb.txt")
+        stream.read(1024 * 1024)
+        assert_raises(DecompressionLimitExceeded, stream.read, 1024)
+
+    def test_streaming_whole(self):
+        """Test that the limits are enforced as a whole member is read, before
+        all of it has been decompressed."""
+        z = ZipPackage(make_bomb(), name="bomb.zip")
+        z.members.sizes[1] = 10
+        z.check_limits()
+
+        stream = z.open("bomb.txt")
+        sizes = []
+        read = stream.stream.read
+        stream.stream.read = lambda size=-1: sizes.append(size) or read(size)
+        assert_raises(DecompressionLimitExceeded, stream.read)
+        eq_(set(sizes), set([CHUNK_SIZE]))
+        assert z.inflated_size < 4 * 1024 * 1024
+
+    def test_reread(self):
+        """Test that members which are read more than once are only counted
+        once against the package limit."""
+        data = StringIO()
+        zf = ZipFile(data, mode="w", compression=ZIP_DEFLATED)
+        zf.writestr("a.js", "a" * 600)
+        zf.writestr("b.js", "b" * 300)
+        zf.close()
+
+        z = ZipPackage(data, name="test.zip", max_size=1000, cache_size=0)
+        z.check_limits()
+        for i in range(3):
+            eq_(z.read("a.js"), "a" * 600)
+            eq_(z.open("b.js").read(100), "b" * 100)
+        eq_(z.read("b.js"), "b" * 300)
+        eq_(z.inflated_size, 900)
+
+    def test_reported(self):
+        """Test that the validator reports packages over the limits."""
+        err = ErrorBundle()
+        submain.test_package(err, make_bomb(), "bomb.zip")
+        eq_(err.errors[0]["id"],
+            ("main", "test_package", "decompression_limit"))
+        eq_(err.errors[0]["file"], "bomb.txt")
+        eq_(len(err.errors), 1)
+
+
+class TestStoredViews(TestCase):
+    def setUp(self):
+        super(TestStoredViews, self).setUp()
+        with tempfile.NamedTemporaryFile(suffix=".zip", delete=False) as t:
+            self.path = t.name
+        zf = ZipFile(self.path, mode="w")
+        zf.writestr("icon.png", "\x89PNG" + "x" * 100, ZIP_STORED)
+        zf.writestr("app.js", "alert();" * 100, ZIP_DEFLATED)
+        zf.close()
+
+    def tearDown(self):
+        os.unlink(self.path)
+
+    def test_view(self):
+        """Test that stored members are viewed straight from the package."""
+        z = ZipPackage(self.path)
+        view = z.view("icon.png")
+        assert isinstance(view, buffer)
+        eq_(str(view), "\x89PNG" + "x" * 100)
+        eq_(z.view("app.js"), None)
+        assert_raises(KeyError, z.view, "missing.png")
+
+        stream = z.open("icon.png")
+        eq_(stream.read(4), "\x89PNG")
+        eq_(stream.read(), "x" * 100)
+        eq_(z.read("app.js"), "alert();" * 100)
+
+    def test_not_on_disk(self):
+        """Test that packages which aren't files on disk aren't mapped."""
+        with open(self.path, "rb") as package:
+            z = ZipPackage(StringIO(package.read()), name="test.zip")
+        eq_(z.view("icon.png"), None)
+        eq_(z.read("icon.png"), "\x89PNG" + "x" * 100)
+
+    def test_bad_crc(self):
+        """Test that the CRC of stored members is checked when streamed."""
+        with open(self.path, "r+b") as package:
+            data = package.read()
+            package.seek(data.index("xxxx"))
+            package.write("yyyy")
+
+        z = ZipPackage(self.path)
+        eq_(z.open("icon.png").read(4), "\x89PNG")
+        assert_raises(BadZipfile, z.read, "icon.png")
+
+    def test_view_checked(self):
+        """Test that views are checked like the data that is read."""
+        with open(self.path, "r+b") as package:
+            data = package.read()
+            package.seek(data.index("xxxx"))
+            package.write("yyyy")
+        assert_raises(BadZipfile, ZipPackage(self.path).view, "icon.png")
+
+        z = ZipPackage(self.path, max_size=50)
+        assert_raises(DecompressionLimitExceeded, z.view, "icon.png")
+
+    def test_view_counted(self):
+        """Test that views count against the decompression limits once."""
+        z = ZipPackage(self.path)
+        z.view("icon.png")
+        z.view("icon.png")
+        eq_(z.inflated_size, 104)
+
+    def test_close(self):
+        """Test that closing the package releases its memory map."""
+        with ZipPackage(self.path) as z:
+            z.view("icon.png")
+            mapped = z._mmap
+        assert_raises(ValueError, mapped.read, 1)
+        eq_(z.view("icon.png"), None)
+
+    def test_closed_by_validation(self):
+        """Test that packages are closed once they have been validated."""
+        with patch.object(ZipPackage, "close") as close:
+            with open(self.path, "rb") as package:
+                submain.test_package(ErrorBundle(), package, self.path)
+        eq_(close.call_count, 1)
+
 
 class TestBadZipFile(TestCase):
     @raises(IOError)
     def test_missing_file(self):
         """Tests that the XPI manager correctly reports a missing XPI file."""
         ZipPackage("foo.bar")
+
+
+class TestFileCache(TestCase):
+    def test_eviction(self):
+        """Test that the least recently used members are evicted."""
+        cache = FileCache(10)
+        cache.put('a', 'aaaa')
+        cache.put('b', 'bbbb')
+        eq_(cache.get('a'), 'aaaa')
+        cache.put('c', 'cccc')
+
+        assert 'a' in cache
+        assert 'b' not in cache
+        assert 'c' in cache
+        eq_(cache.size, 8)
+
+        # Members which would never fit aren't cached.
+        cache.put('d', 'd' * 11)
+        assert 'd' not in cache
+        eq_(cache.get('d'), None)
+
+        stats = cache.stats()
+        eq_(stats['hits'], 1)
+        eq_(stats['misses'], 1)
+        eq_(stats['evictions'], 1)
+
+    def test_pinning(self):
+        """Test that pinned members are never evicted."""
+        cache = FileCache(10)
+        cache.put('a', 'aaaa')
+        cache.pin('a')
+        cache.pin('b')
+        cache.put('b', 'b' * 12)
+        cache.put('c', 'cccc')
+
+        eq_(cache.get('a'), 'aaaa')
+        eq_(cache.get('b'), 'b' * 12)
+        assert 'c' not in cache
+
+    def test_package_cache(self):
+        """Test that package reads go through the cache."""
+        z = ZipPackage(get_path('xpi/install_rdf_only.xpi'), cache_size=1)
+        data = z.read('install.rdf')
+        eq_(z.read('install.rdf'), data)
+        eq_(z.file_cache.stats()['hits'], 0)
+        eq_(z.file_cache.stats()['misses'], 2)
+
+        z.file_cache.pin('install.rdf')
+        z.read('install.rdf')
+        z.read('install.rdf')
+        eq_(z.file_cache.stats()['hits'], 1)
+
+    def test_text(self):
+        """Test that text is cached alongside data, within the same
+        budget."""
+        cache = FileCache(10 + 2 * UNICODE_SIZE)
+        cache.put('a', 'aaaa')
+        cache.put('a', u'aa', text=True)
+        eq_(cache.get('a'), 'aaaa')
+        eq_(cache.get('a', text=True), u'aa')
+        eq_(cache.size, 4 + 2 * UNICODE_SIZE)
+        eq_(cache.stats()['decodes'], 1)
+
+        # The data of 'a' is the least recently used.
+        cache.put('b', 'bbbbbbb')
+        eq_(cache.get('a'), None)
+        eq_(cache.get('a', text=True), u'aa')
+
+        cache.discard('a')
+        eq_(cache.get('a', text=True), None)
+        eq_(cache.size, 7)
+
+    def test_package_text(self):
+        """Test that each member is decoded once."""
+        zip_data = StringIO()
+        zf = ZipFile(zip_data, mode="w")
+        zf.writestr("latin_1.txt", "t\xe4st")
+        zf.close()
+        z = ZipPackage(zip_data, name="test.zip")
+
+        eq_(z.read_text("latin_1.txt"), u"t\xe4st")
+        eq_(z.read_text("latin_1.txt"), u"t\xe4st")
+        stats = z.file_cache.stats()
+        eq_(stats['decodes'], 1)
+        # Each read is counted once, whichever caches it looked in.
+        eq_((stats['hits'], stats['misses']), (1, 1))
+        eq_(z.encodings, {"latin_1.txt": ("latin_1", 0.5)})